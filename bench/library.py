@@ -0,0 +1,70 @@
+import datetime
+import os
+import random
+import sqlite3
+
+from db.schema import SCHEMA_VERSION, ensure_schema
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+WORDS = [
+    "the", "of", "a", "and", "in", "night", "garden", "river", "history", "world", "secret",
+    "machine", "learning", "city", "stone", "winter", "summer", "light", "shadow", "house",
+    "introduction", "practical", "guide", "modern", "ancient", "letters", "silent", "theory",
+    "children", "sea", "memory", "empire", "island", "notes", "complete", "essays", "road",
+]
+JAPANESE_TITLES = ["E資格精選問題集", "吾輩は猫である", "ノルウェイの森", "雪国", "こころ", "羅生門", "人間失格"]
+
+def random_title(rng):
+    if rng.random() < 0.05:
+        return rng.choice(JAPANESE_TITLES)
+    # 1-9 words, mostly 2-5, like real titles
+    words = rng.choices(WORDS, k=max(1, min(9, int(rng.gauss(3.5, 1.8)))))
+    return " ".join(words).capitalize()
+
+def random_book(rng, today):
+    total_pages = max(20, min(1500, int(rng.lognormvariate(5.6, 0.5))))
+    registered = today - datetime.timedelta(days=rng.randint(0, 3 * 365))
+    # Targets spread from two months overdue to a year ahead
+    target = today + datetime.timedelta(days=rng.randint(-60, 365))
+    finished = rng.random() < 0.2
+    read_pages = total_pages if finished else rng.randint(0, total_pages)
+    return (random_title(rng), total_pages, read_pages, registered.isoformat(), target.isoformat(), finished)
+
+# Write a book table of `size` synthetic rows to `path`
+def generate_library(path, size, seed=0, chunk_size=50_000):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    conn = sqlite3.connect(path)
+    try:
+        ensure_schema(conn)
+        with conn:
+            for start in range(0, size, chunk_size):
+                rows = [random_book(rng, today) for _ in range(min(chunk_size, size - start))]
+                conn.executemany(
+                    """
+                    INSERT INTO book (title, total_pages, read_pages, registered_date, target_date, finished)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
+                )
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+# Path of a generated library of `size` rows, built on first use and reused afterwards.
+# Dates are relative to the day the file was generated. The schema version is
+# part of the name: a library from an older schema would be migrated inside the
+# timed startup instead.
+def library_path(size, seed=0):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    name = f"library-{size}-{seed}-v{SCHEMA_VERSION}-{datetime.date.today().isoformat()}.db"
+    path = os.path.join(DATA_DIR, name)
+    if not os.path.exists(path):
+        print(f"Generating a library of {size} books...")
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        generate_library(tmp_path, size, seed)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,257 @@
+# Headless benchmarks of the book list hot paths.
+#
+#   python -m bench.run [--sizes 1000 100000 1000000] [--repeat 5] [--output results.json]
+#
+# Prints one JSON document with a result per (benchmark, library size).
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.library import library_path
+from db.books import STATUSES, ConnectionManager, get_sorted_data
+from db.schema import ensure_schema
+from db.transfer import export_file, import_file
+from viewmodel import BookListModel, open_session
+
+def measure(name, size, fn, repeat):
+    timings = []
+    rows = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "name": name,
+        "size": size,
+        "repeat": repeat,
+        "rows": rows,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+# The load-sort-format pipeline behind BookList.update_book_list
+def render_first_page(model):
+    views = [model.row_view(book) for book in model.reset()]
+    model.summary_text()
+    return len(views)
+
+def toggle_and_render(model, sort_by):
+    model.toggle_sort(sort_by)
+    return render_first_page(model)
+
+def run_size(size, repeat):
+    source = library_path(size)
+    workdir = tempfile.mkdtemp(prefix="yomou-bench-")
+    path = os.path.join(workdir, "books.db")
+    shutil.copy(source, path)
+    results = []
+    manager = ConnectionManager(path)
+    try:
+        results.extend(run_startup(size, path, repeat))
+        results.extend(run_transfer(size, manager, workdir, repeat))
+
+        results.append(measure("cache_load", size, lambda: len(open_session(manager)), repeat))
+        cache = open_session(manager)
+        model = BookListModel(cache)
+        results.append(measure("render_first_page", size, lambda: render_first_page(model), repeat))
+        results.append(measure("sort_read_percentage", size,
+                               lambda: toggle_and_render(model, "read_percentage"), repeat))
+        # The first target_date toggle builds that order; later ones reuse it
+        results.append(measure("sort_target_date", size,
+                               lambda: toggle_and_render(model, "target_date"), repeat))
+
+        # Switching the status filter; the first switch builds that status's order
+        for status in STATUSES:
+            def filter_and_render(status=status):
+                model.set_status(status)
+                return render_first_page(model)
+            results.append(measure(f"filter_{status}", size, filter_and_render, repeat))
+            # The same page straight from SQL, through the status's partial index
+            with manager.connection() as conn:
+                results.append(measure(f"sql_page_{status}", size, lambda: len(
+                    get_sorted_data(conn, "target_date", limit=model.PAGE_SIZE, status=status)), repeat))
+        model.set_status(None)
+
+        # Reading plan across the active books: a full build, then one book's
+        # progress changing and the plan being read again
+        results.append(measure("planner_rebuild", size, lambda: (
+            model.planner.rebuild(cache.all(), model.metrics.today), model.planner.summary())[1].books, repeat))
+        planned = cache.page("target_date", limit=1, status="active")
+
+        def plan_update():
+            book = dataclasses.replace(planned[0], read_pages=(planned[0].read_pages + 1) % planned[0].total_pages)
+            planned[0] = book
+            model.planner.replace(book.id, book)
+            model.planner.days(14)
+            return model.planner.summary().books
+        results.append(measure("planner_update", size, plan_update, repeat))
+
+        def scroll_page():
+            views = [model.row_view(book) for book in model.load_more()]
+            return len(views)
+        render_first_page(model)
+        results.append(measure("scroll_page", size, scroll_page, repeat))
+
+        # Register.register_book, edit and delete: DB write, cache, list position and summary
+        inserted = []
+        def insert():
+            book = cache.insert("Benchmark book", 300, 0, datetime.date.today() + datetime.timedelta(days=30))
+            inserted.append(book)
+            model.insert(book)
+            model.summary_text()
+            return 1
+        results.append(measure("insert", size, insert, repeat))
+
+        def edit():
+            book = inserted[-1]
+            saved = cache.update(dataclasses.replace(book, read_pages=book.read_pages + 1))
+            inserted[-1] = saved
+            model.update(saved)
+            model.row_view(saved)
+            model.summary_text()
+            return 1
+        results.append(measure("edit", size, edit, repeat))
+
+        def delete():
+            book = inserted.pop()
+            cache.delete(book.id)
+            model.remove(book.id)
+            model.summary_text()
+            return 1
+        results.append(measure("delete", size, delete, repeat))
+    finally:
+        manager.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+# Cold start in a fresh interpreter: imports and the first frame (Register and
+# the list skeleton), then schema check, cache load and the first page of books
+def run_startup(size, path, repeat):
+    process_timings, first_frame_timings, session_timings = [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.run", "--startup", path],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout
+        process_timings.append((time.perf_counter() - start) * 1000)
+        timings = json.loads(output.strip().splitlines()[-1])
+        first_frame_timings.append(timings["first_frame_ms"])
+        session_timings.append(timings["session_ms"])
+    return [
+        summarize("startup_process", size, process_timings),
+        summarize("startup_first_frame", size, first_frame_timings),
+        summarize("startup_session", size, session_timings),
+    ]
+
+# Bulk export and import through db/transfer.py, in rows per second. Each
+# import goes into a new, empty library.
+def run_transfer(size, manager, workdir, repeat):
+    results = []
+    for extension in ("csv", "jsonl"):
+        path = os.path.join(workdir, f"export.{extension}")
+        results.append(throughput(measure(f"export_{extension}", size, lambda: export_file(manager, path), repeat)))
+        imports = iter(range(repeat))
+
+        def import_library():
+            target = ConnectionManager(os.path.join(workdir, f"import-{extension}-{next(imports)}.db"))
+            try:
+                with target.connection() as conn:
+                    ensure_schema(conn)
+                return import_file(target, path).imported
+            finally:
+                target.close()
+        results.append(throughput(measure(f"import_{extension}", size, import_library, repeat)))
+    return results
+
+def throughput(result):
+    result["rows_per_sec"] = round(result["rows"] / result["median_ms"] * 1000) if result["median_ms"] else None
+    return result
+
+def summarize(name, size, timings):
+    return {
+        "name": name,
+        "size": size,
+        "repeat": len(timings),
+        "rows": None,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+def startup(path):
+    start = time.perf_counter()
+    try:
+        # Same module import cost as a real launch, without opening a window
+        import main
+    except ImportError:
+        main = None
+    imported = time.perf_counter()
+    if main is not None:
+        # The controls of the first frame; nothing in it waits for the library
+        main.Yomou(None)
+    first_frame = time.perf_counter()
+    manager = ConnectionManager(path)
+    model = BookListModel(open_session(manager))
+    render_first_page(model)
+    manager.close()
+    done = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "first_frame_ms": (first_frame - start) * 1000,
+        "session_ms": (done - first_frame) * 1000,
+    }))
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless yomou benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--startup", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup:
+        startup(args.startup)
+        return
+
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(size, args.repeat))
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Headless soak test: drives the real app (main.py) on an in-process Flet page
+# through thousands of register / edit / date picker / sort / delete cycles,
+# and fails when the memory still allocated after them grows past a threshold.
+#
+#   python -m bench.soak [--cycles 2000] [--size 1000] [--max-growth-kb 512]
+#
+# Runs on a copy of a generated library (bench/library.py), with backups and
+# sync off, and with YOMOU_INSTRUMENT_MEMORY=1 so the report shows how much
+# each handler left allocated. Exits with 1 when memory or the page's control
+# index grew too much, after printing where the memory was allocated.
+import argparse
+import asyncio
+import datetime
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+WORKDIR = tempfile.mkdtemp(prefix="yomou-soak-")
+
+# Before the app's modules are imported: they read these once
+os.environ["YOMOU_INSTRUMENT_MEMORY"] = "1"
+os.environ["YOMOU_INSTRUMENT_FILE"] = os.devnull  # The soak prints its own report
+os.environ["YOMOU_BACKUP_INTERVAL"] = "0"
+os.environ["YOMOU_BACKUP_DIR"] = os.path.join(WORKDIR, "backups")
+os.environ.pop("YOMOU_SYNC_DIR", None)
+os.environ.pop("YOMOU_SERVER", None)
+
+from flet.core.local_connection import LocalConnection
+from flet.core.page import Page
+from flet.core.protocol import PageCommandResponsePayload, PageCommandsBatchResponsePayload
+
+import db.books
+from bench.library import library_path
+from instrumentation import live_controls, memory, recorder, traced_bytes
+
+# A connection that applies the page's commands in-process, like the Flet
+# client would, without a window
+class HeadlessConnection(LocalConnection):
+    def send_command(self, session_id, command):
+        result, _ = self._process_command(command)
+        return PageCommandResponsePayload(result=result, error="")
+
+    def send_commands(self, session_id, commands):
+        results = []
+        for command in commands:
+            result, _ = self._process_command(command)
+            if result:
+                results.append(result)
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+# Queued DB work and the callbacks it schedules have run
+def settle(worker):
+    worker.submit(lambda: None).result()
+
+def cycle(app, worker, number):
+    register, book_list = app.register, app.book_list
+    register.value_dict = {
+        "title": f"Soak book {number}",
+        "total_pages": 300,
+        "read_pages": 0,
+        "target_date": datetime.date.today() + datetime.timedelta(days=30 + number % 60),
+    }
+    register.open_date_picker(None)
+    app.overlays.date_dismissed(None)
+    register.register_book(None)
+    settle(worker)
+    book = max(app.cache.all(), key=lambda book: book.id)
+
+    book_list.open_edit_dialog(book)
+    settle(worker)
+    dialog = app.overlays.instances["edit_book"]
+    dialog.read_pages_input.value = str(number % 300)
+    dialog.update_book(None)
+    settle(worker)
+
+    book_list.sort_by_target_date(None)
+    book_list.sort_by_read_percentage(None)
+    settle(worker)
+
+    book_list.open_edit_dialog(app.cache.get(book.id))
+    settle(worker)
+    app.overlays.instances["edit_book"].delete_book()
+    settle(worker)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless memory soak test of the yomou app")
+    parser.add_argument("--cycles", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100, help="Cycles run before the baseline is taken")
+    parser.add_argument("--size", type=int, default=1000, help="Books in the library")
+    parser.add_argument("--max-growth-kb", type=float, default=512,
+                        help="Fail when more memory than this is still allocated after the cycles")
+    parser.add_argument("--max-control-growth", type=int, default=50,
+                        help="Fail when the page indexes more controls than this after the cycles")
+    parser.add_argument("--report-every", type=int, default=500)
+    args = parser.parse_args()
+
+    path = os.path.join(WORKDIR, "books.db")
+    shutil.copy(library_path(args.size), path)
+    db.books.manager.db_path = path
+    import main as app_main
+    from db.worker import worker
+
+    page = Page(HeadlessConnection(), "soak", asyncio.new_event_loop())
+    devnull = open(os.devnull, "w")
+    try:
+        with redirect_stdout(devnull):
+            app_main.main(page)
+            settle(worker)
+        app = page.controls[0].content
+
+        with redirect_stdout(devnull):
+            for number in range(args.warmup):
+                cycle(app, worker, number)
+        gc.collect()
+        memory.reset()
+        recorder.reset()
+        baseline_bytes = traced_bytes()
+        baseline_controls = live_controls(page)
+        print(f"Baseline after {args.warmup} cycles: {baseline_bytes / 1e6:.1f} MB traced, "
+              f"controls {baseline_controls}")
+
+        start = time.perf_counter()
+        for number in range(args.warmup, args.warmup + args.cycles):
+            with redirect_stdout(devnull):
+                cycle(app, worker, number)
+            done = number - args.warmup + 1
+            if done % args.report_every == 0 or done == args.cycles:
+                gc.collect()
+                traced = traced_bytes()
+                print(f"{done} cycles, {done / (time.perf_counter() - start):.0f}/s: "
+                      f"{(traced - baseline_bytes) / 1024:+.1f} KB, controls {live_controls(page)}", flush=True)
+    finally:
+        if page.controls:
+            page.controls[0].content.close()
+        worker.stop()
+        devnull.close()
+
+    growth_kb = (traced - baseline_bytes) / 1024
+    control_growth = live_controls(page)["indexed"] - baseline_controls["indexed"]
+    print("Largest growth by line:")
+    for location, size, count in memory.growth(10):
+        print(f"  {location}: {size / 1024:+.1f} KB ({count:+} blocks)")
+    print("Allocated per call, by handler:")
+    for name, stats in recorder.snapshot().items():
+        if name.startswith("ui.") and stats["count"]:
+            print(f"  {name}: {stats['allocated_bytes'] / stats['count'] / 1024:+.2f} KB over {stats['count']} calls")
+
+    failed = growth_kb > args.max_growth_kb or control_growth > args.max_control_growth
+    print(f"{'FAIL' if failed else 'OK'}: {growth_kb:+.1f} KB retained (limit {args.max_growth_kb:g}), "
+          f"{control_growth:+} indexed controls (limit {args.max_control_growth}) over {args.cycles} cycles")
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import BASE_DIR, db_path
+
+# Snapshots of the library, taken with SQLite's online backup API on a
+# background thread while the app keeps reading and writing.
+#
+#   python -m db.backup list
+#   python -m db.backup backup
+#   python -m db.backup restore [SNAPSHOT]     (with the app closed)
+#
+# YOMOU_BACKUP_DIR: where snapshots are kept (default: backups/ next to the code)
+# YOMOU_BACKUP_INTERVAL: hours between scheduled backups, 0 for none (default 24)
+# YOMOU_BACKUP_KEEP: snapshots kept; older ones are deleted (default 7)
+# YOMOU_BACKUP_MAX_AGE: days after which a snapshot is deleted, 0 for no limit
+#   (default 0). The newest snapshot is always kept.
+BACKUP_DIR = os.environ.get("YOMOU_BACKUP_DIR", os.path.join(BASE_DIR, "backups"))
+BACKUP_INTERVAL = float(os.environ.get("YOMOU_BACKUP_INTERVAL", "24")) * 3600
+BACKUP_KEEP = int(os.environ.get("YOMOU_BACKUP_KEEP", "7"))
+BACKUP_MAX_AGE = float(os.environ.get("YOMOU_BACKUP_MAX_AGE", "0")) * 86400
+
+# Pages copied per step, and the pause after each step. With 4 KiB pages a
+# step copies 1 MiB, and the pause lets other threads take the GIL and the
+# writer commit between steps.
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+
+SNAPSHOT_PREFIX = "books-"
+SNAPSHOT_SUFFIX = ".db"
+
+
+def snapshot_name(when):
+    return f"{SNAPSHOT_PREFIX}{when.strftime('%Y%m%d-%H%M%S')}{SNAPSHOT_SUFFIX}"
+
+def snapshot_time(name):
+    return datetime.datetime.strptime(name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)], "%Y%m%d-%H%M%S")
+
+# Paths of the snapshots in `directory`, newest first
+def list_snapshots(directory=BACKUP_DIR):
+    if not os.path.isdir(directory):
+        return []
+    names = []
+    for name in os.listdir(directory):
+        if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)):
+            continue
+        try:
+            snapshot_time(name)
+        except ValueError:
+            continue
+        names.append(name)
+    return [os.path.join(directory, name) for name in sorted(names, reverse=True)]
+
+# Copy the database at `source_path` into `target_path`, PAGES_PER_STEP pages at
+# a time. The copy runs in one read transaction on its own connection, so it
+# is a consistent snapshot: in WAL mode commits made meanwhile go to the WAL,
+# neither blocking the copy nor restarting it.
+def copy_database(source_path, target_path, pages=PAGES_PER_STEP, pause=STEP_PAUSE, progress=None):
+    source = sqlite3.connect(source_path, isolation_level=None)
+    target = sqlite3.connect(target_path)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+        def step_done(status, remaining, total):
+            if progress is not None:
+                progress(total - remaining, total)
+            if remaining:
+                time.sleep(pause)
+
+        source.backup(target, pages=pages, progress=step_done)
+        source.execute("COMMIT")
+    finally:
+        target.close()
+        source.close()
+
+def check_database(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise sqlite3.DatabaseError(f"{path} failed the integrity check: {result}")
+
+
+# Takes snapshots of the database at `db_path` into `directory`: on demand with
+# backup_now(), and every `interval` seconds once schedule() was called.
+# Backups run one at a time on their own thread.
+class BackupManager:
+    def __init__(self, db_path, directory=BACKUP_DIR, keep=BACKUP_KEEP, max_age=BACKUP_MAX_AGE,
+                 interval=BACKUP_INTERVAL):
+        self.db_path = db_path
+        self.directory = directory
+        self.keep = keep
+        self.max_age = max_age
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-backup")
+        self.lock = threading.Lock()
+        self.timer = None
+
+    # Returns a Future holding the path of the new snapshot
+    def backup_now(self):
+        return self.executor.submit(self.backup)
+
+    def backup(self):
+        os.makedirs(self.directory, exist_ok=True)
+        now = datetime.datetime.now()
+        path = os.path.join(self.directory, snapshot_name(now))
+        partial = path + ".partial"
+        start = time.perf_counter()
+        try:
+            copy_database(self.db_path, partial)
+            check_database(partial)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        print(f"Backed up {self.db_path} to {path} in {time.perf_counter() - start:.1f} s.")
+        self.prune(now)
+        return path
+
+    # Delete the snapshots beyond `keep` or older than `max_age`, newest kept always
+    def prune(self, now=None):
+        now = now or datetime.datetime.now()
+        for index, path in enumerate(list_snapshots(self.directory)):
+            if index == 0:
+                continue
+            age = (now - snapshot_time(os.path.basename(path))).total_seconds()
+            if index >= self.keep or (self.max_age and age > self.max_age):
+                os.remove(path)
+
+    # Back up every `interval` seconds, counting from the newest snapshot, so
+    # restarting the app does not take one each time
+    def schedule(self):
+        if not self.interval or self.timer is not None:
+            return
+        snapshots = list_snapshots(self.directory)
+        delay = 0
+        if snapshots:
+            age = (datetime.datetime.now() - snapshot_time(os.path.basename(snapshots[0]))).total_seconds()
+            delay = max(self.interval - age, 0)
+        self._start_timer(delay)
+
+    def _start_timer(self, delay):
+        with self.lock:
+            self.timer = threading.Timer(delay, self._scheduled)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _scheduled(self):
+        try:
+            self.backup_now().result()
+        except Exception as e:
+            print(f"Error backing up the library: {e}")
+        self._start_timer(self.interval)
+
+    def stop(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        self.executor.shutdown(wait=True)
+
+
+# Replace the library at `target_path` with `snapshot`. The current contents
+# are backed up first, so a restore can itself be undone.
+def restore(snapshot, target_path, directory=BACKUP_DIR):
+    check_database(snapshot)
+    if os.path.exists(target_path):
+        backups = BackupManager(target_path, directory=directory, keep=sys.maxsize, max_age=0, interval=0)
+        print(f"Saved the current library as {backups.backup()}")
+    copy_database(snapshot, target_path, pages=-1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up or restore the yomou library")
+    parser.add_argument("command", choices=["list", "backup", "restore"])
+    parser.add_argument("snapshot", nargs="?", help="restore: snapshot file (default: the newest)")
+    parser.add_argument("--db", default=db_path, help="Library (default: %(default)s)")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="Snapshot directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for path in list_snapshots(args.dir):
+            print(f"{os.path.basename(path)}  {os.path.getsize(path) / 1e6:.1f} MB")
+        return 0
+    if args.command == "backup":
+        BackupManager(args.db, directory=args.dir, interval=0).backup()
+        return 0
+
+    snapshot = args.snapshot
+    if snapshot is None:
+        snapshots = list_snapshots(args.dir)
+        if not snapshots:
+            print(f"No snapshots in {args.dir}")
+            return 1
+        snapshot = snapshots[0]
+    elif not os.path.exists(snapshot):
+        snapshot = os.path.join(args.dir, snapshot)
+    restore(snapshot, args.db, args.dir)
+    print(f"Restored {args.db} from {snapshot}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
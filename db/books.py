@@ -1,22 +1,367 @@
+import atexit
+import datetime
+import queue
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from operator import itemgetter
+from typing import Optional
 
-def connect_to_database(db_path):
-    conn = sqlite3.connect(db_path)
+from db import db_path
+from instrumentation import connection_factory, instrumented
+
+# Number of prepared statements kept per connection (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 512
+
+@instrumented("db.connect_to_database")
+def connect_to_database(db_path, check_same_thread=True):
+    conn = sqlite3.connect(
+        db_path,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=check_same_thread,
+        factory=connection_factory(),
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
-def get_data(conn, table_name, conditions=None):
+# One row of the book table. Dates are parsed once, when the row is read.
+# Records are immutable: an edit produces a new Book with dataclasses.replace().
+# __slots__ is written out rather than using slots=True, which needs Python 3.10.
+@dataclass(frozen=True)
+class Book:
+    __slots__ = ("id", "title", "total_pages", "read_pages", "registered_date", "target_date", "finished",
+                 "read_ratio")
+    id: int
+    title: str
+    total_pages: int
+    read_pages: int
+    registered_date: datetime.date
+    target_date: datetime.date
+    finished: bool
+    read_ratio: Optional[float]  # Generated column, None when total_pages is 0
+
+    # As slots=True would add: copy and pickle cannot set the fields of a frozen record
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+    # sqlite3 row factory. Rows are read by position: where each field is in
+    # the row is worked out once per query, not once per row.
+    @classmethod
+    def from_row(cls, cursor, row):
+        global _book_columns
+        description, fields_of = _book_columns
+        if cursor.description is not description:
+            description = cursor.description
+            names = [col[0] for col in description]
+            fields_of = itemgetter(*(names.index(field.name) for field in fields(cls)))
+            _book_columns = (description, fields_of)
+        book_id, title, total_pages, read_pages, registered_date, target_date, finished, read_ratio = fields_of(row)
+        return cls(book_id, title, total_pages, read_pages, date_from_iso(registered_date),
+                   date_from_iso(target_date), bool(finished), read_ratio)
+
+date_from_iso = datetime.date.fromisoformat
+# (cursor.description, getter of the Book fields in its rows) of the last query
+# read into Books. sqlite3 hands every row of a query the same description object.
+_book_columns = (None, None)
+
+class InvalidBook(ValueError):
+    pass
+
+# The rules a new book must pass, shared by Register and the importer
+# (db/transfer.py). Takes form or file values (strings) as well as parsed ones
+# and returns (title, total_pages, read_pages, target_date).
+def validate_book(title, total_pages, read_pages, target_date):
+    title = title.strip() if isinstance(title, str) else title
+    if not title or total_pages in (None, ""):
+        raise InvalidBook("Both 'Book title' and 'Total pages' are required.")
+    total_pages = parse_pages(total_pages, "Total pages")
+    read_pages = parse_pages(read_pages or 0, "Read pages")
+    if total_pages < 1:
+        raise InvalidBook("Total pages must be at least 1.")
+    if read_pages > total_pages:
+        raise InvalidBook("Read pages cannot be more than total pages.")
+    if target_date in (None, ""):
+        raise InvalidBook("Target date is required.")
+    return title, total_pages, read_pages, parse_date(target_date, "target date")
+
+def parse_pages(value, label):
+    if isinstance(value, int) and not isinstance(value, bool):
+        pages = value
+    else:
+        try:
+            pages = int(str(value).strip())
+        except ValueError:
+            raise InvalidBook(f"{label} must be a whole number, not {value!r}.") from None
+    if pages < 0:
+        raise InvalidBook(f"{label} cannot be negative.")
+    return pages
+
+def parse_date(value, label):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise InvalidBook(f"Invalid {label} {value!r}, expected YYYY-MM-DD.") from None
+
+def dict_row(cursor, row):
+    return dict(zip((col[0] for col in cursor.description), row))
+
+# Record type for rows of each table; other tables come back as dicts
+ROW_FACTORIES = {"book": Book.from_row}
+
+# Rows read per fetchmany() call when streaming
+CHUNK_SIZE = 500
+
+# Yield rows, reading CHUNK_SIZE rows at a time so memory stays bounded.
+# Pass values for the ? placeholders in `conditions` through `params`.
+# The cursor belongs to `conn`: consume the generator while holding the connection.
+def iter_rows(cursor, chunk_size=CHUNK_SIZE):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+def iter_data(conn, table_name, conditions=None, params=(), chunk_size=CHUNK_SIZE):
     cursor = conn.cursor()
+    cursor.row_factory = ROW_FACTORIES.get(table_name, dict_row)
     if conditions:
-        cursor.execute(f"SELECT * FROM {table_name} WHERE {conditions}")
+        cursor.execute(f"SELECT * FROM {table_name} WHERE {conditions}", params)
     else:
         cursor.execute(f"SELECT * FROM {table_name}")
-    
-    rows = cursor.fetchall()
-    columns = [col[0] for col in cursor.description]
-    result = [{columns[i]: row[i] for i in range(len(columns))} for row in rows]
-    return result
+    yield from iter_rows(cursor, chunk_size)
+
+@instrumented("db.get_data")
+def get_data(conn, table_name, conditions=None, params=()):
+    return list(iter_data(conn, table_name, conditions, params))
+
+# Sort criteria of the book list mapped to their indexed columns
+SORT_COLUMNS = {
+    "read_percentage": "read_ratio",
+    "target_date": "target_date",
+}
+
+# Status filters of the book list. Active and overdue books are the unfinished
+# ones whose target date is ahead or passed (the "Target date passed" rows), so
+# the three statuses split the library. Each condition matches a partial index
+# (see STATUS_INDEXES_DDL in db/schema.py).
+STATUSES = ["active", "overdue", "finished"]
+
+def status_condition(status, today=None):
+    today = today or datetime.date.today()
+    if status == "active":
+        return "finished = 0 AND target_date > ?", (today.isoformat(),)
+    if status == "overdue":
+        return "finished = 0 AND target_date <= ?", (today.isoformat(),)
+    if status == "finished":
+        return "finished = 1", ()
+    raise ValueError(f"Unknown status {status!r}")
+
+# Same test on a Book, for rows already in memory
+def has_status(book, status, today):
+    if status == "finished":
+        return book.finished
+    if book.finished:
+        return False
+    return (book.target_date > today) == (status == "active")
+
+# WHERE clauses selecting the rows after the (sort value, id) pair `after`,
+# in the order they are read. SQLite puts NULL first in ascending order (a book
+# with 0 total pages has a NULL read_ratio) and row-value comparisons with NULL
+# are never true, so those rows get their own range. Splitting instead of OR-ing
+# keeps every range an index scan without a temporary sort.
+def _keyset_conditions(column, ascending, after):
+    value, book_id = after
+    if ascending:
+        if value is None:
+            return [(f"{column} IS NULL AND id > ?", (book_id,)), (f"{column} IS NOT NULL", ())]
+        return [(f"({column}, id) > (?, ?)", (value, book_id))]
+    if value is None:
+        return [(f"{column} IS NULL AND id < ?", (book_id,))]
+    return [(f"({column}, id) < (?, ?)", (value, book_id)), (f"{column} IS NULL", ())]
+
+# Stream books in list order. Keyset pagination: pass the (sort value, id) of the
+# last book already shown as `after` to continue from there without OFFSET.
+# `status` limits the rows to one of STATUSES.
+@instrumented("db.iter_sorted_data")
+def iter_sorted_data(conn, sort_by, ascending=True, after=None, limit=-1, chunk_size=CHUNK_SIZE,
+                     status=None, today=None):
+    column = SORT_COLUMNS[sort_by]
+    order = "ASC" if ascending else "DESC"
+    conditions = [(None, ())] if after is None else _keyset_conditions(column, ascending, after)
+    if status is not None:
+        status_sql, status_params = status_condition(status, today)
+        conditions = [(status_sql if condition is None else f"{status_sql} AND {condition}", status_params + params)
+                      for condition, params in conditions]
+    for condition, params in conditions:
+        where = f"WHERE {condition}" if condition else ""
+        cursor = conn.cursor()
+        cursor.row_factory = Book.from_row
+        # id breaks ties so the order is stable between refreshes and pages
+        cursor.execute(
+            f"SELECT * FROM book {where} ORDER BY {column} {order}, id {order} LIMIT ?",
+            params + (limit,),
+        )
+        for book in iter_rows(cursor, chunk_size):
+            yield book
+            limit -= 1
+        if limit == 0:
+            return
 
-def check_data_exists(conn, table_name, condition):
+def get_sorted_data(conn, sort_by, ascending=True, after=None, limit=-1, status=None):
+    return list(iter_sorted_data(conn, sort_by, ascending, after, limit, status=status))
+
+# Turn what the user typed into an FTS5 query: every word must match the start
+# of a word in the title. Words are quoted so FTS5 syntax is never interpreted.
+def fts_query(text):
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+# Virtual machine steps between two checks of `cancelled` while a search runs
+SEARCH_PROGRESS_STEPS = 1000
+
+# Ids of the books whose title matches `text`, in no particular order, or None
+# when there is nothing to search for. `cancelled` is polled while the query
+# runs; once it returns True the query is interrupted and
+# sqlite3.OperationalError is raised.
+@instrumented("db.search_book_ids")
+def search_book_ids(conn, text, cancelled=None):
+    query = fts_query(text)
+    if not query:
+        return None
+    if cancelled is not None:
+        conn.set_progress_handler(cancelled, SEARCH_PROGRESS_STEPS)
+    try:
+        cursor = conn.execute("SELECT rowid FROM book_fts WHERE book_fts MATCH ?", (query,))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        if cancelled is not None:
+            conn.set_progress_handler(None, 0)
+
+def get_book(conn, book_id):
+    cursor = conn.cursor()
+    cursor.row_factory = Book.from_row
+    cursor.execute("SELECT * FROM book WHERE id = ?", (book_id,))
+    return cursor.fetchone()
+
+def check_data_exists(conn, table_name, condition, params=()):
     cursor = conn.cursor()
-    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table_name} WHERE {condition})")
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table_name} WHERE {condition})", params)
     return cursor.fetchone()[0] == 1
+
+
+# One configured connection shared by the whole process.
+# Flet runs event handlers on worker threads, so access is serialized with a lock.
+class ConnectionManager:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self._conn = None
+
+    def get_connection(self):
+        with self.lock:
+            if self._conn is None:
+                self._conn = connect_to_database(self.db_path, check_same_thread=False)
+            return self._conn
+
+    @contextmanager
+    def connection(self):
+        with self.lock:
+            yield self.get_connection()
+
+    # Commits on success, rolls back on error
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            conn = self.get_connection()
+            with conn:
+                yield conn
+
+    def close(self):
+        with self.lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("PRAGMA optimize")
+            finally:
+                self._conn.close()
+                self._conn = None
+
+
+# Server mode (see db/server.py): many sessions read at once through a pool of
+# connections, while every write runs on the GroupCommitWriter thread, on the
+# one connection it opened with open_writer(). WAL lets the readers carry on
+# while the writer commits.
+class ConnectionPool:
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self.size = size
+        self.idle = queue.LifoQueue()  # Most recently used first: its page cache is warm
+        self.lock = threading.Lock()
+        self.connections = []
+        self.writer_conn = None
+        self.writer_thread = None
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.connections) < self.size:
+                conn = connect_to_database(self.db_path, check_same_thread=False)
+                self.connections.append(conn)
+                return conn
+        return self.idle.get()
+
+    # A pooled connection; on the writer thread, the writer's own connection so
+    # reads see the writes of the batch in progress
+    @contextmanager
+    def connection(self):
+        if threading.current_thread() is self.writer_thread:
+            yield self.writer_conn
+            return
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    # The writer thread owns the transaction; it commits when the batch is done
+    @contextmanager
+    def transaction(self):
+        if threading.current_thread() is not self.writer_thread:
+            raise RuntimeError("Writes must be submitted to the GroupCommitWriter.")
+        yield self.writer_conn
+
+    def open_writer(self):
+        self.writer_conn = connect_to_database(self.db_path, check_same_thread=False)
+        self.writer_thread = threading.current_thread()
+        return self.writer_conn
+
+    def close_writer(self):
+        if self.writer_conn is not None:
+            try:
+                self.writer_conn.execute("PRAGMA optimize")
+            finally:
+                self.writer_conn.close()
+                self.writer_conn = None
+                self.writer_thread = None
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+            self.idle = queue.LifoQueue()
+
+
+manager = ConnectionManager(db_path)
+atexit.register(manager.close)
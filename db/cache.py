@@ -0,0 +1,177 @@
+import bisect
+import datetime
+import threading
+
+from db.books import SORT_COLUMNS, get_book, has_status, iter_sorted_data, search_book_ids
+from db.history import book_pace, weekly_pages
+
+def sort_key(book, sort_by):
+    value = getattr(book, SORT_COLUMNS[sort_by])
+    # SQLite sorts NULL (a book with 0 total pages) before any value
+    return (value is not None, value, book.id)
+
+
+# Session-level cache of the book table keyed by id.
+# Reads never touch the DB; mutations are written through to SQLite first.
+# Commits made by other connections are detected with PRAGMA data_version.
+# self.lock only guards the in-memory state, never a DB call, so readers on
+# the UI side do not wait behind a slow write.
+class BookCache:
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.RLock()
+        self.books = {}  # Book id -> book record
+        self.orders = {}  # (sort_by, status) -> (sorted keys, ids in ascending order)
+        # Ids by finished flag, so a status order is built from its own books only
+        self.groups = {False: set(), True: set()}
+        self.status_day = datetime.date.today()  # Day the active and overdue orders are valid for
+        self.data_version = None
+        self.generation = 0  # Bumped on every full reload
+        self.load()
+
+    def load(self):
+        books, keys = {}, []
+        groups = {False: set(), True: set()}
+        with self.manager.connection() as conn:
+            # Rows stream in read_ratio order, so that order is free
+            for book in iter_sorted_data(conn, "read_percentage"):
+                books[book.id] = book
+                keys.append(sort_key(book, "read_percentage"))
+                groups[book.finished].add(book.id)
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self.lock:
+            self.data_version = data_version
+            self.books = books
+            self.groups = groups
+            self.orders = {("read_percentage", None): (keys, list(books))}
+            self.generation += 1
+
+    # Reload if another connection committed since the last check.
+    # Returns True when the cache was reloaded.
+    def refresh_if_changed(self):
+        with self.manager.connection() as conn:
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return False
+        print("Book table changed outside this session, reloading.")
+        self.load()
+        return True
+
+    def get(self, book_id):
+        return self.books.get(book_id)
+
+    def all(self):
+        with self.lock:
+            return list(self.books.values())
+
+    def __len__(self):
+        return len(self.books)
+
+    # Sorted keys and ids of the books with `status` (None for all books).
+    # Built on first use, then kept current by _add() and _discard().
+    def order(self, sort_by, status=None):
+        with self.lock:
+            today = datetime.date.today()
+            if today != self.status_day:
+                # Books move from active to overdue at midnight
+                self.status_day = today
+                for key in [key for key in self.orders if key[1] in ("active", "overdue")]:
+                    del self.orders[key]
+            if (sort_by, status) not in self.orders:
+                if status is None:
+                    books = self.books.values()
+                else:
+                    group = self.groups[status == "finished"]
+                    books = [book for book in map(self.books.get, group) if has_status(book, status, today)]
+                books = sorted(books, key=lambda book: sort_key(book, sort_by))
+                self.orders[(sort_by, status)] = ([sort_key(book, sort_by) for book in books],
+                                                  [book.id for book in books])
+            return self.orders[(sort_by, status)]
+
+    # A slice of the sorted library, as displayed by the book list
+    def page(self, sort_by, ascending=True, offset=0, limit=None, status=None):
+        with self.lock:
+            ids = self.order(sort_by, status)[1]
+            if ascending:
+                end = None if limit is None else offset + limit
+                selected = ids[offset:end]
+            else:
+                end = len(ids) - offset
+                start = 0 if limit is None else max(end - limit, 0)
+                selected = ids[start:end][::-1]
+            return [self.books[book_id] for book_id in selected]
+
+    # Ids of the books whose title matches `text` (see search_book_ids)
+    def search(self, text, cancelled=None):
+        with self.manager.connection() as conn:
+            return search_book_ids(conn, text, cancelled)
+
+    # Reading history rollups; not cached, they are a few rows each
+    def weekly_pages(self, weeks=12):
+        with self.manager.connection() as conn:
+            return weekly_pages(conn, weeks)
+
+    def book_pace(self, book_id):
+        with self.manager.connection() as conn:
+            return book_pace(conn, book_id)
+
+    def insert(self, title, total_pages, read_pages, target_date):
+        with self.manager.transaction() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO book (title, total_pages, read_pages, registered_date, target_date, finished)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (title, total_pages, read_pages, datetime.date.today().isoformat(), target_date.isoformat(),
+                 read_pages >= total_pages),
+            )
+            book = get_book(conn, cursor.lastrowid)
+        with self.lock:
+            self._add(book)
+        return book
+
+    # A change of read_pages is logged as a reading session, and the history
+    # rollups updated, by a trigger within this transaction (see db/schema.py)
+    def update(self, book):
+        with self.manager.transaction() as conn:
+            conn.execute("""
+                UPDATE book
+                SET title = ?, total_pages = ?, read_pages = ?, target_date = ?
+                WHERE id = ?
+            """, (book.title, book.total_pages, book.read_pages, book.target_date.isoformat(), book.id))
+            # Re-read the row for the generated read_ratio column
+            saved_book = get_book(conn, book.id)
+        with self.lock:
+            self._discard(book.id)
+            self._add(saved_book)
+        return saved_book
+
+    def delete(self, book_id):
+        with self.manager.transaction() as conn:
+            conn.execute("DELETE FROM book WHERE id = ?", (book_id,))
+        with self.lock:
+            return self._discard(book_id)
+
+    def _add(self, book):
+        self.books[book.id] = book
+        self.groups[book.finished].add(book.id)
+        for (sort_by, status), (keys, ids) in self.orders.items():
+            if status is not None and not has_status(book, status, self.status_day):
+                continue
+            key = sort_key(book, sort_by)
+            position = bisect.bisect_left(keys, key)
+            keys.insert(position, key)
+            ids.insert(position, book.id)
+
+    def _discard(self, book_id):
+        book = self.books.pop(book_id, None)
+        if book is None:
+            return None
+        self.groups[book.finished].discard(book.id)
+        for (sort_by, status), (keys, ids) in self.orders.items():
+            if status is not None and not has_status(book, status, self.status_day):
+                continue
+            position = bisect.bisect_left(keys, sort_key(book, sort_by))
+            del keys[position]
+            del ids[position]
+        return book
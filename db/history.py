@@ -0,0 +1,52 @@
+import datetime
+from collections import namedtuple
+
+# Reads of the reading history rollups (see READING_HISTORY_DDL in db/schema.py).
+# Everything here reads aggregate rows; reading_session is never scanned.
+
+WeeklyPages = namedtuple("WeeklyPages", ["week", "pages", "sessions"])
+# pages_per_day over the last PACE_DAYS days; streak counts consecutive days
+# with pages read, ending today or yesterday
+BookPace = namedtuple("BookPace", ["pages_per_day", "streak", "last_read"])
+
+PACE_DAYS = 7
+MAX_STREAK = 366  # Daily rows read at most when counting a streak
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+# Pages read in each of the last `weeks` weeks, oldest first; weeks without
+# reading are included with 0 pages
+def weekly_pages(conn, weeks=12, today=None):
+    today = today or datetime.date.today()
+    first = week_start(today) - datetime.timedelta(weeks=weeks - 1)
+    cursor = conn.execute(
+        "SELECT week, pages, sessions FROM weekly_pages WHERE week >= ?", (first.isoformat(),))
+    rows = {week: (pages, sessions) for week, pages, sessions in cursor.fetchall()}
+    result = []
+    for i in range(weeks):
+        week = first + datetime.timedelta(weeks=i)
+        pages, sessions = rows.get(week.isoformat(), (0, 0))
+        result.append(WeeklyPages(week, pages, sessions))
+    return result
+
+def book_pace(conn, book_id, today=None):
+    today = today or datetime.date.today()
+    cursor = conn.execute(
+        "SELECT day, pages FROM book_daily_pages WHERE book_id = ? ORDER BY day DESC LIMIT ?",
+        (book_id, MAX_STREAK),
+    )
+    days = [(datetime.date.fromisoformat(day), pages) for day, pages in cursor.fetchall()]
+    since = today - datetime.timedelta(days=PACE_DAYS)
+    recent_pages = sum(pages for day, pages in days if day > since)
+
+    streak = 0
+    expected = today
+    for day, pages in days:
+        if day == expected - datetime.timedelta(days=1) and streak == 0:
+            expected = day  # A streak that ended yesterday still counts until today is over
+        if day != expected or pages <= 0:
+            break
+        streak += 1
+        expected = day - datetime.timedelta(days=1)
+    return BookPace(round(recent_pages / PACE_DAYS, 1), streak, days[0][0] if days else None)
@@ -0,0 +1,372 @@
+import uuid
+
+# The database schema, in one place. PRAGMA user_version records the version a
+# file is at; ensure_schema() runs the migrations it is missing, in order.
+# Add a migration by writing a function and appending it to MIGRATIONS.
+
+BOOK_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        total_pages INTEGER NOT NULL,
+        read_pages INTEGER NOT NULL,
+        registered_date DATE NOT NULL,
+        target_date DATE NOT NULL,
+        finished BOOLEAN NOT NULL,
+        read_ratio REAL GENERATED ALWAYS AS (CAST(read_pages AS REAL) / total_pages) STORED
+    )
+"""
+
+BOOK_INDEXES_DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_book_read_ratio ON book (read_ratio)",
+    "CREATE INDEX IF NOT EXISTS idx_book_target_date ON book (target_date)",
+]
+
+# Columns that must be NOT NULL; older databases allowed NULL in some of them
+BOOK_REQUIRED_COLUMNS = ["title", "total_pages", "read_pages", "registered_date", "target_date", "finished"]
+
+# Full-text index on the title. External content: the index stores only the
+# tokens and reads titles from the book table; the triggers keep it in sync.
+# The prefix option adds indexes for 2 and 3 character prefixes, the lengths
+# people typically have typed when search-as-you-type first fires.
+BOOK_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+        title,
+        content='book',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_fts_insert AFTER INSERT ON book BEGIN
+        INSERT INTO book_fts (rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_fts_delete AFTER DELETE ON book BEGIN
+        INSERT INTO book_fts (book_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_fts_update AFTER UPDATE OF title ON book BEGIN
+        INSERT INTO book_fts (book_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO book_fts (rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+]
+
+# Reading history: one reading_session row per change of read_pages, plus
+# rollups kept current in the same transaction by the trigger, so stats read a
+# handful of aggregate rows instead of scanning every session.
+# Weeks start on Monday. A deleted book's sessions and daily rows go with it;
+# the weekly totals keep what was read.
+# 'now' is the same for every statement of one trigger run. `condition` is
+# empty in version 3 and keeps the trigger quiet during sync from version 6.
+READING_SESSION_TRIGGER_DDL = """
+    CREATE TRIGGER IF NOT EXISTS book_reading_session AFTER UPDATE OF read_pages ON book
+    WHEN new.read_pages != old.read_pages{condition} BEGIN
+        INSERT INTO reading_session (book_id, read_at, pages)
+        VALUES (new.id, datetime('now', 'localtime'), new.read_pages - old.read_pages);
+        INSERT INTO book_daily_pages (book_id, day, pages, sessions)
+        VALUES (new.id, date('now', 'localtime'), new.read_pages - old.read_pages, 1)
+        ON CONFLICT (book_id, day) DO UPDATE SET pages = pages + excluded.pages, sessions = sessions + 1;
+        INSERT INTO weekly_pages (week, pages, sessions)
+        VALUES (date('now', 'localtime', 'weekday 0', '-6 days'), new.read_pages - old.read_pages, 1)
+        ON CONFLICT (week) DO UPDATE SET pages = pages + excluded.pages, sessions = sessions + 1;
+    END
+    """
+
+READING_HISTORY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS reading_session (
+        id INTEGER PRIMARY KEY,
+        book_id INTEGER NOT NULL,
+        read_at TEXT NOT NULL,
+        pages INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_reading_session_book ON reading_session (book_id, read_at)",
+    """
+    CREATE TABLE IF NOT EXISTS book_daily_pages (
+        book_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        pages INTEGER NOT NULL,
+        sessions INTEGER NOT NULL,
+        PRIMARY KEY (book_id, day)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS weekly_pages (
+        week DATE PRIMARY KEY,
+        pages INTEGER NOT NULL,
+        sessions INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    READING_SESSION_TRIGGER_DDL.format(condition=""),
+    """
+    CREATE TRIGGER IF NOT EXISTS book_reading_delete AFTER DELETE ON book BEGIN
+        DELETE FROM reading_session WHERE book_id = old.id;
+        DELETE FROM book_daily_pages WHERE book_id = old.id;
+    END
+    """,
+]
+
+# A book is finished once all its pages are read. Writers may set finished
+# themselves; these triggers correct it when they did not, so the column
+# always agrees with the pages. The nested UPDATE only touches finished and
+# fires no other trigger.
+FINISHED_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS book_finished_insert AFTER INSERT ON book
+    WHEN new.finished != (new.read_pages >= new.total_pages) BEGIN
+        UPDATE book SET finished = (new.read_pages >= new.total_pages) WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_finished_update AFTER UPDATE OF read_pages, total_pages ON book
+    WHEN new.finished != (new.read_pages >= new.total_pages) BEGIN
+        UPDATE book SET finished = (new.read_pages >= new.total_pages) WHERE id = new.id;
+    END
+    """,
+]
+
+# Partial indexes per status, one per sort column. A status filter reads only
+# the entries of its own books: finished ones never slow down browsing the
+# active and overdue books, however many there are.
+# ("target_date < date('now')" cannot be an index condition, as it changes
+# daily; overdue is a range of the unfinished target_date index instead.)
+STATUS_INDEXES_DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_book_unfinished_read_ratio ON book (read_ratio) WHERE finished = 0",
+    "CREATE INDEX IF NOT EXISTS idx_book_unfinished_target_date ON book (target_date) WHERE finished = 0",
+    "CREATE INDEX IF NOT EXISTS idx_book_finished_read_ratio ON book (read_ratio) WHERE finished = 1",
+    "CREATE INDEX IF NOT EXISTS idx_book_finished_target_date ON book (target_date) WHERE finished = 1",
+]
+
+# Sync journal (see db/sync.py). Every change to a synced field of a book is
+# logged with the device it was made on, that device's running sequence number
+# and a UTC timestamp; remote changes are logged as they are applied, with
+# their origin. A device's sync vector is the highest sequence number it holds
+# from each device. Books are matched across devices by uuid.
+# A new book is logged as one '_created' change holding a JSON array of its
+# fields in SYNCED_FIELDS order, a deletion as '_deleted', and an edit as one
+# change per field it changed.
+# While db/sync.py applies remote changes it sets sync_meta 'applying', and
+# the triggers stay quiet so those changes are not logged again as local ones.
+SYNCED_FIELDS = ["title", "total_pages", "read_pages", "registered_date", "target_date"]
+SYNC_STAMP = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+SYNC_QUIET = "NOT EXISTS (SELECT 1 FROM sync_meta WHERE key = 'applying')"
+SYNC_NEXT_SEQ = "(SELECT COALESCE(MAX(device_seq), 0) FROM book_change WHERE device = device_id.value)"
+# A version 7 UUID: the current time in milliseconds, then random bits. New
+# books' uuids sort in the order they were added, so their entries land at the
+# same end of the uuid indexes instead of all over them.
+SQL_UUID7 = """(
+    SELECT substr(t, 1, 8) || '-' || substr(t, 9, 4) || '-7' || substr(h, 1, 3) || '-'
+           || substr('89ab', 1 + abs(random()) % 4, 1) || substr(h, 4, 3) || '-' || substr(h, 7, 12)
+    FROM (SELECT printf('%012x', CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)) AS t,
+                 lower(hex(randomblob(9))) AS h)
+)"""
+
+def _json_fields(prefix):
+    return f"json_array({', '.join(f'{prefix}.{field}' for field in SYNCED_FIELDS)})"
+
+def _changed_fields():
+    return "\n            UNION ALL ".join(
+        f"SELECT '{field}' AS field, new.{field} AS value WHERE old.{field} IS NOT new.{field}"
+        for field in SYNCED_FIELDS
+    )
+
+SYNC_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS sync_meta (
+        key TEXT PRIMARY KEY,
+        value
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS book_change (
+        seq INTEGER PRIMARY KEY,
+        device TEXT NOT NULL,
+        device_seq INTEGER NOT NULL,
+        book_uuid TEXT NOT NULL,
+        field TEXT NOT NULL,
+        value,
+        stamp TEXT NOT NULL
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_book_change_origin ON book_change (device, device_seq)",
+    "CREATE INDEX IF NOT EXISTS idx_book_change_field ON book_change (book_uuid, field, stamp)",
+    # Highest sequence number applied from each other device
+    """
+    CREATE TABLE IF NOT EXISTS sync_peer (
+        device TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_sync_insert AFTER INSERT ON book BEGIN
+        UPDATE book SET uuid = {SQL_UUID7} WHERE id = new.id AND new.uuid IS NULL;
+        INSERT INTO book_change (device, device_seq, book_uuid, field, value, stamp)
+        SELECT device_id.value, {SYNC_NEXT_SEQ} + 1, book.uuid, '_created', {_json_fields("new")}, {SYNC_STAMP}
+        FROM sync_meta AS device_id, book
+        WHERE device_id.key = 'device' AND book.id = new.id AND {SYNC_QUIET};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_sync_update AFTER UPDATE OF {", ".join(SYNCED_FIELDS)} ON book
+    WHEN {SYNC_QUIET} BEGIN
+        INSERT INTO book_change (device, device_seq, book_uuid, field, value, stamp)
+        SELECT device_id.value, {SYNC_NEXT_SEQ} + row_number() OVER (), new.uuid, fields.field, fields.value, {SYNC_STAMP}
+        FROM sync_meta AS device_id, (
+            {_changed_fields()}
+        ) AS fields
+        WHERE device_id.key = 'device';
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_sync_delete AFTER DELETE ON book
+    WHEN {SYNC_QUIET} BEGIN
+        INSERT INTO book_change (device, device_seq, book_uuid, field, value, stamp)
+        SELECT device_id.value, {SYNC_NEXT_SEQ} + 1, old.uuid, '_deleted', 1, {SYNC_STAMP}
+        FROM sync_meta AS device_id
+        WHERE device_id.key = 'device';
+    END
+    """,
+]
+
+def table_exists(conn, table_name):
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone() is not None
+
+# Column name -> (notnull, hidden) from PRAGMA table_xinfo, which unlike
+# table_info also lists generated columns
+def table_columns(conn, table_name):
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_xinfo({table_name})")
+    return {row[1]: (row[3], row[6]) for row in cursor.fetchall()}
+
+
+## Migrations. Each runs inside the transaction opened by ensure_schema().
+
+# Version 1: the book table with NOT NULL columns and the generated read_ratio.
+# Databases made by earlier releases (nullable read_pages and finished, no
+# read_ratio) are rebuilt: a STORED generated column cannot be added with
+# ALTER TABLE, nor can NOT NULL be added to a column.
+def migrate_book_table(conn):
+    if table_exists(conn, "book"):
+        columns = table_columns(conn, "book")
+        if "read_ratio" not in columns or not all(columns[name][0] for name in BOOK_REQUIRED_COLUMNS):
+            rebuild_book_table(conn)
+    else:
+        conn.execute(BOOK_TABLE_DDL.format(name="book"))
+    for ddl in BOOK_INDEXES_DDL:
+        conn.execute(ddl)
+
+def rebuild_book_table(conn):
+    print("Migrating book table to the current schema.")
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'book'").fetchone()
+    conn.execute("DROP TABLE IF EXISTS book_new")
+    conn.execute(BOOK_TABLE_DDL.format(name="book_new"))
+    conn.execute("""
+        INSERT INTO book_new (id, title, total_pages, read_pages, registered_date, target_date, finished)
+        SELECT id, title, total_pages, COALESCE(read_pages, 0), registered_date, target_date, COALESCE(finished, 0)
+        FROM book
+    """)
+    # Dropping the table drops its indexes and triggers too; later migrations recreate them
+    conn.execute("DROP TABLE book")
+    conn.execute("ALTER TABLE book_new RENAME TO book")
+    # Keep AUTOINCREMENT from reusing ids of books deleted before the migration
+    if seq is not None:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'book'", (seq[0],))
+
+# Version 2: full-text search on the title, filled from the existing rows
+def create_search_index(conn):
+    for ddl in BOOK_FTS_DDL:
+        conn.execute(ddl)
+    conn.execute("INSERT INTO book_fts (book_fts) VALUES ('rebuild')")
+
+# Version 3: reading sessions and their rollups. History starts empty: the
+# read_pages of existing books were not logged as sessions.
+def create_reading_history(conn):
+    for ddl in READING_HISTORY_DDL:
+        conn.execute(ddl)
+
+# Version 4: finished follows the pages, with partial indexes per status.
+# Releases before it wrote finished = 0 for every book.
+def track_finished(conn):
+    conn.execute("UPDATE book SET finished = (read_pages >= total_pages) WHERE finished != (read_pages >= total_pages)")
+    for ddl in FINISHED_DDL + STATUS_INDEXES_DDL:
+        conn.execute(ddl)
+    conn.execute("ANALYZE book")
+
+# Version 5: the sync journal. Existing books get a uuid derived from their id,
+# title and registration date, so copies of one library file made before the
+# upgrade agree on them, and their current values are logged with the oldest
+# possible stamp: the first sync sends them, and any real edit wins over them.
+SYNC_NAMESPACE = uuid.UUID("6f1c1d3e-3b0e-4a53-9d55-2f7b5f0a9c41")
+SYNC_EPOCH = "1970-01-01T00:00:00.000Z"
+
+def create_sync_journal(conn):
+    conn.execute("ALTER TABLE book ADD COLUMN uuid TEXT")
+    rows = conn.execute("SELECT id, title, registered_date FROM book").fetchall()
+    conn.executemany("UPDATE book SET uuid = ? WHERE id = ?", [
+        (str(uuid.uuid5(SYNC_NAMESPACE, f"{book_id}\x1f{title}\x1f{registered}")), book_id)
+        for book_id, title, registered in rows
+    ])
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_book_uuid ON book (uuid)")
+    # The log is filled before its indexes are built: twice as fast on a large library
+    device = str(uuid.uuid4())
+    conn.execute(SYNC_DDL[1])  # book_change
+    conn.execute(f"""
+        INSERT INTO book_change (device, device_seq, book_uuid, field, value, stamp)
+        SELECT ?, id, uuid, '_created', {_json_fields("book")}, ? FROM book
+    """, (device, SYNC_EPOCH))
+    for ddl in SYNC_DDL:
+        conn.execute(ddl)
+    conn.execute("INSERT OR IGNORE INTO sync_meta (key, value) VALUES ('device', ?)", (device,))
+
+# Version 6: read_pages received from another device were read there, on
+# another day, so applying them must not log a reading session here. The
+# reading session trigger now stays quiet during sync, like the log triggers.
+def quiet_reading_history_during_sync(conn):
+    conn.execute("DROP TRIGGER IF EXISTS book_reading_session")
+    conn.execute(READING_SESSION_TRIGGER_DDL.format(condition=f" AND {SYNC_QUIET}"))
+
+# MIGRATIONS[n] brings a database from version n to version n + 1
+MIGRATIONS = [
+    migrate_book_table,
+    create_search_index,
+    create_reading_history,
+    track_finished,
+    create_sync_journal,
+    quiet_reading_history_during_sync,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Bring the database up to SCHEMA_VERSION. When it already is, this is a
+# single PRAGMA read. Returns True when migrations ran.
+def ensure_schema(conn):
+    if schema_version(conn) == SCHEMA_VERSION:
+        return False
+    conn.commit()
+    # IMMEDIATE takes the write lock first, so two processes starting together
+    # do not both migrate; the version is read again under the lock
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = schema_version(conn)
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"Database schema version {version} is newer than this app ({SCHEMA_VERSION}).")
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        # PRAGMA does not take parameters; SCHEMA_VERSION is an int
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return version < SCHEMA_VERSION
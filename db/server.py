@@ -0,0 +1,44 @@
+import atexit
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from db import db_path
+from db.backup import BackupManager
+from db.books import ConnectionManager, ConnectionPool, manager as local_manager
+from db.sync import SYNC_DIR, DirectoryTransport, SyncEngine
+from db.worker import worker
+from db.writer import GroupCommitWriter
+
+# Server mode: YOMOU_SERVER=1 serves the app with Flet web, where many sessions
+# share this process and books.db. Reads run on a pool of connections
+# (YOMOU_READ_POOL, default 4), writes on a single group-committing writer,
+# and sessions tell each other about changes through page.pubsub.
+SERVER_MODE = os.environ.get("YOMOU_SERVER", "") not in ("", "0")
+SERVER_PORT = int(os.environ.get("YOMOU_PORT", "8550"))
+READ_POOL_SIZE = int(os.environ.get("YOMOU_READ_POOL", "4"))
+
+# `reader` runs queries and `writer` runs INSERT/UPDATE/DELETE; both have the
+# DatabaseWorker submit() interface and return Futures
+if SERVER_MODE:
+    manager = ConnectionPool(db_path, READ_POOL_SIZE)
+    writer = GroupCommitWriter(manager)
+    reader = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="db-reader")
+    # atexit runs last-registered first: the writer commits before the pool closes
+    atexit.register(manager.close)
+    atexit.register(writer.stop)
+else:
+    # Desktop: a single session, the DatabaseWorker thread does all DB work
+    manager = local_manager
+    writer = reader = worker
+
+# Snapshots of the library on a background thread (see db/backup.py); stopped
+# first at exit so a running backup finishes before the connections close
+backups = BackupManager(manager.db_path)
+atexit.register(backups.stop)
+
+# Delta sync with other devices through YOMOU_SYNC_DIR (see db/sync.py), on its
+# own connection and thread; None when no directory is set
+syncer = None
+if SYNC_DIR:
+    syncer = SyncEngine(ConnectionManager(manager.db_path), DirectoryTransport(SYNC_DIR))
+    atexit.register(syncer.stop)
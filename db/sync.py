@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import sys
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from db import db_path
+from db.books import ConnectionManager
+from db.schema import SYNCED_FIELDS, ensure_schema
+
+# Delta sync between devices sharing a directory (a network share, a synced
+# folder...). Each device publishes the changes made on it, from the change
+# log the triggers keep (SYNC_DDL in db/schema.py), as numbered files under
+# its own subdirectory, and reads from the others' subdirectories only what
+# lies past its sync vector. A sync costs in proportion to the changes since
+# the last one, whatever the size of the library.
+#
+#   python -m db.sync /path/to/shared/dir [--db books.db]
+#
+# Conflicts are settled per field, last writer wins: the value with the latest
+# (stamp, device, sequence) is kept, so two devices editing different fields of
+# one book both keep their edit. A deletion wins over any edit.
+SYNC_DIR = os.environ.get("YOMOU_SYNC_DIR", "")
+
+# Field names of a new book and of a deletion in the change log (see SYNC_DDL)
+CREATED = "_created"
+DELETED = "_deleted"
+
+Change = namedtuple("Change", ["device", "device_seq", "book_uuid", "field", "value", "stamp"])
+SyncResult = namedtuple("SyncResult", ["sent", "received", "applied"])
+
+
+def device_id(conn):
+    return conn.execute("SELECT value FROM sync_meta WHERE key = 'device'").fetchone()[0]
+
+def meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM sync_meta WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+def set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)", (key, value))
+
+# Give this library a new device id, for a library file copied to another
+# device: both copies would otherwise publish under the same id. The changes
+# logged so far stay under the old id and count as already held from it.
+def new_device(conn):
+    old = device_id(conn)
+    device = str(uuid.uuid4())
+    conn.execute("""
+        INSERT OR REPLACE INTO sync_peer (device, seq)
+        SELECT device, MAX(device_seq) FROM book_change WHERE device = ?
+    """, (old,))
+    set_meta(conn, "device", device)
+    conn.execute("DELETE FROM sync_meta WHERE key = 'published'")
+    return device
+
+# Highest sequence number held from each other device
+def peer_vector(conn):
+    return dict(conn.execute("SELECT device, seq FROM sync_peer").fetchall())
+
+# Changes made on `device` after its sequence number `after`, in order
+def changes_since(conn, device, after):
+    cursor = conn.execute("""
+        SELECT device, device_seq, book_uuid, field, value, stamp FROM book_change
+        WHERE device = ? AND device_seq > ? ORDER BY device_seq
+    """, (device, after))
+    return [Change(*row) for row in cursor.fetchall()]
+
+# (field, value) pairs a change sets
+def change_fields(change):
+    if change.field == CREATED:
+        return list(zip(SYNCED_FIELDS, json.loads(change.value)))
+    if change.field in SYNCED_FIELDS:
+        return [(change.field, change.value)]
+    return []
+
+# ((stamp, device, sequence), value) of the newest logged change to a field,
+# or (None, None)
+def latest_value(conn, book_uuid, field):
+    row = conn.execute("""
+        SELECT stamp, device, device_seq, field, value FROM book_change
+        WHERE book_uuid = ? AND field IN (?, ?) ORDER BY stamp DESC, device DESC, device_seq DESC LIMIT 1
+    """, (book_uuid, field, CREATED)).fetchone()
+    if row is None:
+        return None, None
+    value = row[4] if row[3] == field else json.loads(row[4])[SYNCED_FIELDS.index(field)]
+    return tuple(row[:3]), value
+
+def is_logged(conn, book_uuid, field):
+    return conn.execute("SELECT 1 FROM book_change WHERE book_uuid = ? AND field = ? LIMIT 1",
+                        (book_uuid, field)).fetchone() is not None
+
+# Apply changes from other devices within the caller's transaction. Changes
+# already held are skipped; the rest are logged with their origin, then
+# applied field by field where they win. Returns the number of changes that
+# altered the book table.
+def apply_changes(conn, changes):
+    vector = peer_vector(conn)
+    set_meta(conn, "applying", 1)  # Keeps the triggers from logging these again
+    try:
+        applied = 0
+        created = set()  # Books first seen in this batch, inserted at the end
+        for change in changes:
+            if change.device_seq <= vector.get(change.device, 0):
+                continue
+            version = (change.stamp, change.device, change.device_seq)
+            fields = [(field, value, latest_value(conn, change.book_uuid, field)[0])
+                      for field, value in change_fields(change)]
+            conn.execute("""
+                INSERT INTO book_change (device, device_seq, book_uuid, field, value, stamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, change)
+            vector[change.device] = change.device_seq
+            if change.field == DELETED:
+                applied += conn.execute("DELETE FROM book WHERE uuid = ?", (change.book_uuid,)).rowcount
+                created.discard(change.book_uuid)
+            elif not fields or is_logged(conn, change.book_uuid, DELETED):
+                continue
+            elif conn.execute("SELECT 1 FROM book WHERE uuid = ?", (change.book_uuid,)).fetchone() is None:
+                created.add(change.book_uuid)
+            else:
+                changed = 0
+                for field, value, latest in fields:
+                    if latest is None or version > latest:
+                        # The field name comes from SYNCED_FIELDS, never from the file
+                        changed |= conn.execute(
+                            f"UPDATE book SET {field} = ? WHERE uuid = ? AND {field} IS NOT ?",
+                            (value, change.book_uuid, value),
+                        ).rowcount
+                applied += changed
+        for book_uuid in created:
+            applied += create_book(conn, book_uuid)
+        conn.executemany("INSERT OR REPLACE INTO sync_peer (device, seq) VALUES (?, ?)", vector.items())
+    finally:
+        conn.execute("DELETE FROM sync_meta WHERE key = 'applying'")
+    return applied
+
+# Insert a book known so far only from the change log, from the newest logged
+# value of each field. Returns 1, or 0 while its creation is not held yet.
+def create_book(conn, book_uuid):
+    if not is_logged(conn, book_uuid, CREATED):
+        return 0
+    values = [latest_value(conn, book_uuid, field)[1] for field in SYNCED_FIELDS]
+    read_pages, total_pages = values[SYNCED_FIELDS.index("read_pages")], values[SYNCED_FIELDS.index("total_pages")]
+    conn.execute(f"""
+        INSERT INTO book ({", ".join(SYNCED_FIELDS)}, finished, uuid)
+        VALUES ({", ".join("?" * len(SYNCED_FIELDS))}, ?, ?)
+    """, values + [read_pages >= total_pages, book_uuid])
+    return 1
+
+
+# Transport through a shared directory: device D's changes are in
+# D/<first seq>-<last seq>.jsonl, one JSON change per line. Files are written
+# under a temporary name and renamed, so readers never see half a file.
+class DirectoryTransport:
+    def __init__(self, root):
+        self.root = root
+
+    def publish(self, device, changes):
+        if not changes:
+            return
+        directory = os.path.join(self.root, device)
+        os.makedirs(directory, exist_ok=True)
+        name = f"{changes[0].device_seq:012d}-{changes[-1].device_seq:012d}.jsonl"
+        path = os.path.join(directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for change in changes:
+                f.write(json.dumps(change._asdict(), ensure_ascii=False) + "\n")
+        os.replace(path + ".tmp", path)
+
+    # Changes of the other devices past `vector`, in order per device
+    def fetch(self, device, vector):
+        if not os.path.isdir(self.root):
+            return
+        for peer in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, peer)
+            if peer == device or not os.path.isdir(directory):
+                continue
+            held = vector.get(peer, 0)
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith(".jsonl"):
+                    continue
+                if int(name[:-len(".jsonl")].split("-")[1]) <= held:
+                    continue
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    for line in f:
+                        change = Change(**json.loads(line))
+                        if change.device == peer and change.device_seq > held:
+                            yield change
+
+
+# One sync: publish this device's new changes, then apply the others'. The
+# engine has its own connection and runs one sync at a time on its own thread,
+# each in one IMMEDIATE transaction: it sees only committed changes, so should
+# the transaction fail after publishing, the same changes are published again
+# next time and skipped by whoever already has them. Other connections notice
+# the applied changes through PRAGMA data_version.
+class SyncEngine:
+    def __init__(self, manager, transport):
+        self.manager = manager
+        self.transport = transport
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-sync")
+
+    # Returns a Future holding the SyncResult
+    def sync_now(self):
+        return self.executor.submit(self.sync)
+
+    def sync(self):
+        with self.manager.transaction() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            device = device_id(conn)
+            outgoing = changes_since(conn, device, meta(conn, "published", 0))
+            self.transport.publish(device, outgoing)
+            if outgoing:
+                set_meta(conn, "published", outgoing[-1].device_seq)
+            incoming = list(self.transport.fetch(device, peer_vector(conn)))
+            applied = apply_changes(conn, incoming)
+        if applied:
+            print(f"Sync applied {applied} changes from other devices.")
+        return SyncResult(len(outgoing), len(incoming), applied)
+
+    def stop(self):
+        self.executor.shutdown(wait=True)
+        self.manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the yomou library through a shared directory")
+    parser.add_argument("directory", nargs="?", default=SYNC_DIR, help="Shared directory (default: $YOMOU_SYNC_DIR)")
+    parser.add_argument("--db", default=db_path, help="Library (default: %(default)s)")
+    parser.add_argument("--new-device", action="store_true",
+                        help="Sync as a new device: use once on a library file copied from another device")
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error("no shared directory given and YOMOU_SYNC_DIR is not set")
+
+    engine = SyncEngine(ConnectionManager(args.db), DirectoryTransport(args.directory))
+    try:
+        with engine.manager.connection() as conn:
+            ensure_schema(conn)
+        if args.new_device:
+            with engine.manager.transaction() as conn:
+                print(f"This library now syncs as device {new_device(conn)}")
+        result = engine.sync()
+        print(f"Sent {result.sent} changes, received {result.received}, {result.applied} applied.")
+    finally:
+        engine.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
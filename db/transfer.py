@@ -0,0 +1,182 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+from collections import namedtuple
+
+from db import db_path
+from db.books import ConnectionManager, InvalidBook, iter_rows, parse_date, validate_book
+from db.schema import ensure_schema
+
+# Bulk import and export of the book table, as CSV or JSON Lines (one object
+# per line). Both stream: export reads the table in chunks, import validates
+# and inserts CHUNK_SIZE rows at a time, all in one transaction.
+#
+#   python -m db.transfer export books.csv
+#   python -m db.transfer import books.jsonl [--rejects rejects.csv]
+#
+# Ids are not carried over: imported books get new ids in the target library.
+
+COLUMNS = ["title", "total_pages", "read_pages", "registered_date", "target_date", "finished"]
+CHUNK_SIZE = 1000  # Rows per executemany() call
+PROGRESS_ROWS = 10_000  # Rows between progress reports
+
+INSERT_SQL = f"INSERT INTO book ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+# rejects is a list of (line number, message)
+ImportResult = namedtuple("ImportResult", ["imported", "rejects"])
+
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".json", ".jsonl", ".ndjson"):
+        return "json"
+    raise ValueError(f"Unknown file type {extension!r}: use .csv, .json or .jsonl")
+
+
+## Import
+
+# Readers yield (line number, fields); fields is a dict of column -> value, or
+# an InvalidBook for a line that could not be parsed
+def read_csv(f):
+    reader = csv.DictReader(f)
+    for fields in reader:
+        yield reader.line_num, fields
+
+def read_json(f):
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError as e:
+            yield number, InvalidBook(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(fields, dict):
+            fields = InvalidBook("Expected a JSON object.")
+        yield number, fields
+
+READERS = {"csv": read_csv, "json": read_json}
+
+# Values for INSERT_SQL, or InvalidBook. The finished column of the file is
+# ignored: a book is finished when all its pages are read.
+def book_values(fields, today):
+    if isinstance(fields, Exception):
+        raise fields
+    title, total_pages, read_pages, target_date = validate_book(
+        fields.get("title"), fields.get("total_pages"), fields.get("read_pages"), fields.get("target_date"))
+    registered_date = fields.get("registered_date")
+    registered_date = parse_date(registered_date, "registered date") if registered_date else today
+    return (title, total_pages, read_pages, registered_date.isoformat(), target_date.isoformat(),
+            read_pages >= total_pages)
+
+# Insert the valid rows of `records` (see the readers); invalid ones are
+# skipped and reported. Run it inside a transaction: nothing is committed here.
+# progress(imported, rejected) is called after every PROGRESS_ROWS rows and at the end.
+def import_books(conn, records, chunk_size=CHUNK_SIZE, progress=None):
+    today = datetime.date.today()
+    imported, rejects, chunk = 0, [], []
+    reported = 0
+    for line, fields in records:
+        try:
+            chunk.append(book_values(fields, today))
+        except InvalidBook as e:
+            rejects.append((line, str(e)))
+        if len(chunk) >= chunk_size:
+            conn.executemany(INSERT_SQL, chunk)
+            imported += len(chunk)
+            chunk = []
+            if progress is not None and imported - reported >= PROGRESS_ROWS:
+                progress(imported, len(rejects))
+                reported = imported
+    if chunk:
+        conn.executemany(INSERT_SQL, chunk)
+        imported += len(chunk)
+    if progress is not None:
+        progress(imported, len(rejects))
+    return ImportResult(imported, rejects)
+
+def import_file(manager, path, chunk_size=CHUNK_SIZE, progress=None):
+    # utf-8-sig drops the byte order mark Excel writes at the start of CSV files
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        records = READERS[file_format(path)](f)
+        with manager.transaction() as conn:
+            return import_books(conn, records, chunk_size, progress)
+
+
+## Export
+
+# Exported rows as dicts, read CHUNK_SIZE at a time in id order
+def iter_export_rows(conn):
+    cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM book ORDER BY id")
+    for row in iter_rows(cursor, CHUNK_SIZE):
+        fields = dict(zip(COLUMNS, row))
+        fields["finished"] = bool(fields["finished"])
+        yield fields
+
+def write_csv(f, rows):
+    writer = csv.DictWriter(f, fieldnames=COLUMNS)
+    writer.writeheader()
+    count = 0
+    for fields in rows:
+        fields["finished"] = int(fields["finished"])
+        writer.writerow(fields)
+        count += 1
+    return count
+
+def write_json(f, rows):
+    count = 0
+    for fields in rows:
+        f.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+WRITERS = {"csv": write_csv, "json": write_json}
+
+# Returns the number of rows written
+def export_file(manager, path):
+    writer = WRITERS[file_format(path)]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        with manager.connection() as conn:
+            return writer(f, iter_export_rows(conn))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the yomou book table")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("file", help="A .csv, .json or .jsonl file (JSON Lines: one book object per line)")
+    parser.add_argument("--db", default=db_path, help="Library to use (default: %(default)s)")
+    parser.add_argument("--rejects", help="Import: write the rejected lines and reasons to this CSV file")
+    args = parser.parse_args()
+
+    manager = ConnectionManager(args.db)
+    try:
+        with manager.connection() as conn:
+            ensure_schema(conn)
+        if args.command == "export":
+            print(f"Exported {export_file(manager, args.file)} books to {args.file}")
+            return 0
+
+        def progress(imported, rejected):
+            print(f"Imported {imported} books, rejected {rejected}")
+
+        result = import_file(manager, args.file, progress=progress)
+        for line, message in result.rejects[:20]:
+            print(f"Line {line}: {message}")
+        if len(result.rejects) > 20:
+            print(f"... and {len(result.rejects) - 20} more rejected lines")
+        if args.rejects:
+            with open(args.rejects, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["line", "message"])
+                writer.writerows(result.rejects)
+        return 1 if result.rejects else 0
+    finally:
+        manager.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import atexit
+import queue
+import threading
+from concurrent.futures import Future
+
+
+# Runs database work on a single dedicated thread so Flet event handlers never
+# wait on SQLite. Jobs run one at a time in submission order, so clicks that
+# arrive together are applied in the order they were made.
+class DatabaseWorker:
+    def __init__(self, name="db-worker"):
+        self.name = name
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+
+    # Queue fn(*args, **kwargs); the returned Future holds its result or exception
+    def submit(self, fn, *args, **kwargs):
+        self.start()
+        future = Future()
+        self.queue.put((future, fn, args, kwargs))
+        return future
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    # Finish queued jobs, then stop the thread
+    def stop(self):
+        with self.lock:
+            if self.thread is None:
+                return
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+worker = DatabaseWorker()
+atexit.register(worker.stop)
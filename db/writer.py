@@ -0,0 +1,91 @@
+import queue
+import time
+
+from db.worker import DatabaseWorker
+from instrumentation import record
+
+# How long the writer waits for more writes to join a batch, in seconds
+GROUP_COMMIT_WINDOW = 0.002
+# Most writes committed together
+MAX_BATCH = 64
+
+
+# Single writer thread for server mode. A DatabaseWorker (same submit() and
+# stop()), but writes that arrive close together are committed in one
+# transaction (group commit): one fsync for the whole batch instead of one
+# per write. Each job runs in its own savepoint, so a failing job is rolled
+# back alone and the others are still committed. Futures are resolved only
+# after the COMMIT.
+class GroupCommitWriter(DatabaseWorker):
+    def __init__(self, pool, window=GROUP_COMMIT_WINDOW, max_batch=MAX_BATCH, name="db-writer"):
+        super().__init__(name)
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self.on_rollback = None  # Called when a COMMIT fails, e.g. to reload caches
+
+    def _run(self):
+        conn = self.pool.open_writer()
+        try:
+            stopping = False
+            while not stopping:
+                job = self.queue.get()
+                if job is None:
+                    break
+                batch = [job]
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                self._commit(conn, batch)
+        finally:
+            self.pool.close_writer()
+
+    def _commit(self, conn, batch):
+        start = time.perf_counter()
+        outcomes = []  # (future, result, exception)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            # E.g. "database is locked" while a sync, import or restore holds
+            # the lock past the busy timeout: fail this batch, keep the thread
+            print(f"Error starting a transaction for {len(batch)} writes: {e}")
+            for future, _, _, _ in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+        for future, fn, args, kwargs in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT job")
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                outcomes.append((future, None, e))
+            else:
+                conn.execute("RELEASE job")
+                outcomes.append((future, result, None))
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Error committing {len(outcomes)} writes: {e}")
+            outcomes = [(future, None, e) for future, _, _ in outcomes]
+            if self.on_rollback is not None:
+                self.on_rollback()
+        record("db.group_commit", (time.perf_counter() - start) * 1000, rows=len(outcomes))
+        for future, result, exception in outcomes:
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
@@ -0,0 +1,386 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+
+# Opt-in: YOMOU_INSTRUMENT=1 turns recording on, YOMOU_INSTRUMENT_FILE sets
+# where the JSON report is written on exit. When off, every hook below is a
+# no-op and the wrapped functions are returned unchanged.
+# YOMOU_INSTRUMENT_MEMORY=1 also traces allocations with tracemalloc (and
+# turns recording on): each operation records the memory it left allocated,
+# and the report lists live control counts and where memory grew. Tracing
+# makes Python allocations several times slower, so it is off by default.
+# YOMOU_INSTRUMENT_MEMORY_FRAMES sets the traceback depth kept per allocation.
+MEMORY = os.environ.get("YOMOU_INSTRUMENT_MEMORY", "") not in ("", "0")
+MEMORY_FRAMES = int(os.environ.get("YOMOU_INSTRUMENT_MEMORY_FRAMES", "1"))
+ENABLED = MEMORY or os.environ.get("YOMOU_INSTRUMENT", "") not in ("", "0")
+REPORT_FILE = os.environ.get("YOMOU_INSTRUMENT_FILE", "yomou-instrumentation.json")
+
+# Upper bounds of the latency buckets in milliseconds; the last bucket is unbounded
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+# Latency histogram of one operation, plus totals of the rows it touched, of
+# the controls it sent and of the bytes it left allocated (memory tracing only)
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.rows = 0
+        self.controls = 0
+        self.allocated = 0
+
+    def record(self, ms, rows=None, controls=None, allocated=None):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        if rows is not None:
+            self.rows += rows
+        if controls is not None:
+            self.controls += controls
+        if allocated is not None:
+            self.allocated += allocated
+
+    # Upper bound of the bucket holding the given fraction of the calls, capped at the max
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= fraction * self.count:
+                return min(BUCKETS_MS[index], round(self.max_ms, 3)) if index < len(BUCKETS_MS) else round(self.max_ms, 3)
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "controls": self.controls,
+            "allocated_bytes": self.allocated,
+            "buckets": {
+                (f"<={bound}" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}"): count
+                for i, (bound, count) in enumerate(zip(BUCKETS_MS + (None,), self.buckets))
+                if count
+            },
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # Operation name -> Histogram
+        self.started = time.time()
+
+    def record(self, name, ms, rows=None, controls=None, allocated=None):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(ms, rows, controls, allocated)
+
+    def snapshot(self):
+        with self.lock:
+            return {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.started = time.time()
+
+    # One line per operation, slowest total first, for the in-app readout
+    def report_lines(self):
+        operations = sorted(self.snapshot().items(), key=lambda item: -item[1]["total_ms"])
+        return [
+            f"{name}: {stats['count']}× p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, "
+            f"max {stats['max_ms']} ms, rows {stats['rows']}, controls {stats['controls']}"
+            + (f", allocated {stats['allocated_bytes'] / 1024:+.1f} KB" if MEMORY else "")
+            for name, stats in operations
+        ]
+
+    def dump(self, path=REPORT_FILE):
+        report = {"started": self.started, "finished": time.time(), "operations": self.snapshot()}
+        if MEMORY:
+            report["memory"] = memory.report()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Instrumentation report written to {path}")
+
+
+recorder = Recorder()
+
+def record(name, ms, rows=None, controls=None, allocated=None):
+    if ENABLED:
+        recorder.record(name, ms, rows, controls, allocated)
+
+# Bytes currently allocated by Python, or None when memory is not traced
+def traced_bytes():
+    return tracemalloc.get_traced_memory()[0] if MEMORY and tracemalloc.is_tracing() else None
+
+# Net bytes allocated since traced_bytes() returned `before`. Other threads
+# allocating meanwhile count too, so it is exact only for operations that do
+# not overlap.
+def allocated_since(before):
+    after = traced_bytes()
+    return None if before is None or after is None else after - before
+
+@contextmanager
+def timed(name):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.record(name, (time.perf_counter() - start) * 1000)
+
+# Decorator timing every call of fn under `name`. Generator functions are timed
+# until the generator is exhausted or closed, and the items they yield are
+# counted as rows.
+def instrumented(name):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                before = traced_bytes()
+                start = time.perf_counter()
+                rows = 0
+                try:
+                    for item in fn(*args, **kwargs):
+                        rows += 1
+                        yield item
+                finally:
+                    recorder.record(name, (time.perf_counter() - start) * 1000, rows=rows,
+                                    allocated=allocated_since(before))
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            before = traced_bytes()
+            start = time.perf_counter()
+            rows = None
+            try:
+                result = fn(*args, **kwargs)
+                if isinstance(result, list):
+                    rows = len(result)
+                return result
+            finally:
+                recorder.record(name, (time.perf_counter() - start) * 1000, rows=rows,
+                                allocated=allocated_since(before))
+        return wrapper
+    return decorate
+
+
+## SQLite
+
+# "SELECT book", "UPDATE book", "PRAGMA data_version", ...
+STATEMENT_PATTERN = re.compile(
+    r"^\s*(?:(SELECT)\b.*?\bFROM\s+(\w+)|(INSERT)\s+(?:OR\s+\w+\s+)?INTO\s+(\w+)|(UPDATE)\s+(\w+)"
+    r"|(DELETE)\s+FROM\s+(\w+)|(PRAGMA)\s+(\w+)|(\w+))",
+    re.IGNORECASE | re.DOTALL,
+)
+
+def statement_name(sql):
+    match = STATEMENT_PATTERN.match(sql)
+    if match is None:
+        return "db.other"
+    words = [group for group in match.groups() if group]
+    return "db." + " ".join([words[0].upper()] + words[1:])
+
+# Cursor recording each statement's latency and the rows it wrote or fetched
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            recorder.record(statement_name(sql), (time.perf_counter() - start) * 1000,
+                            rows=self.rowcount if self.rowcount >= 0 else None)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            recorder.record(statement_name(sql), (time.perf_counter() - start) * 1000,
+                            rows=self.rowcount if self.rowcount >= 0 else None)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        recorder.record("db.fetch", (time.perf_counter() - start) * 1000, rows=0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        recorder.record("db.fetch", (time.perf_counter() - start) * 1000, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        recorder.record("db.fetch", (time.perf_counter() - start) * 1000, rows=len(rows))
+        return rows
+
+# Connection factory for sqlite3.connect(); every cursor it hands out is instrumented
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            recorder.record("db.commit", (time.perf_counter() - start) * 1000)
+
+def connection_factory():
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+
+## Flet
+
+# Number of controls in the subtrees rooted at `controls`
+def tree_size(controls):
+    size = 0
+    stack = list(controls)
+    while stack:
+        control = stack.pop()
+        size += 1
+        stack.extend(child for child in control._get_children() if child is not None)
+    return size
+
+# Time every page.update() (Control.update() goes through it too) and record
+# the size of the control trees it had to diff and send
+def install_page(page):
+    if not ENABLED:
+        return
+    memory.watch(page)
+    update = page.update
+
+    def instrumented_update(*controls):
+        start = time.perf_counter()
+        try:
+            update(*controls)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            recorder.record("page.update", elapsed, controls=tree_size(controls or (page,)))
+
+    page.update = instrumented_update
+
+
+## Memory
+
+# Controls alive in a page: in its tree (views, overlay, dialogs, snack bar),
+# and in its index of every control it has sent and not yet seen removed.
+# Controls that leave the tree but stay indexed are leaking.
+def live_controls(page):
+    return {
+        "tree": tree_size([page]),
+        "overlay": len(page.overlay),
+        "indexed": len(getattr(page, "_index", ())),
+    }
+
+# tracemalloc snapshots of a session: memory growth since a baseline, by the
+# source line that allocated it, next to the live control counts of the pages
+class MemoryTracker:
+    # Allocations of the tracing itself and of imports are left out of growth()
+    IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>",
+                     "<frozen importlib._bootstrap_external>", "<unknown>")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.baseline = None
+        self.pages = weakref.WeakSet()
+
+    def start(self, frames=MEMORY_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.reset()
+
+    def watch(self, page):
+        self.pages.add(page)
+
+    # Growth is measured from here on
+    def reset(self):
+        snapshot = tracemalloc.take_snapshot()
+        with self.lock:
+            self.baseline = snapshot
+
+    # (location, size change in bytes, count change) of the lines whose
+    # allocations grew most since the baseline. The per-line statistics are
+    # filtered rather than the snapshot's traces: there are far fewer of them.
+    def growth(self, limit=10):
+        with self.lock:
+            baseline = self.baseline
+        if baseline is None:
+            return []
+        lines = []
+        for stat in tracemalloc.take_snapshot().compare_to(baseline, "lineno"):
+            if stat.size_diff <= 0 or stat.traceback[0].filename in self.IGNORED_FILES:
+                continue
+            lines.append((str(stat.traceback[0]), stat.size_diff, stat.count_diff))
+            if len(lines) == limit:
+                break
+        return lines
+
+    def report(self, limit=10):
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "pages": [live_controls(page) for page in list(self.pages)],
+            "growth": [
+                {"location": location, "size_diff": size, "count_diff": count}
+                for location, size, count in self.growth(limit)
+            ],
+        }
+
+    # For the in-app readout
+    def report_lines(self, limit=10):
+        report = self.report(limit)
+        lines = [f"Traced: {report['traced_bytes'] / 1e6:.1f} MB, peak {report['peak_bytes'] / 1e6:.1f} MB"]
+        for counts in report["pages"]:
+            lines.append(f"Controls: {counts['tree']} in the page, {counts['overlay']} overlay entries, "
+                         f"{counts['indexed']} indexed")
+        lines.extend(f"{entry['location']}: {entry['size_diff'] / 1024:+.1f} KB ({entry['count_diff']:+} blocks)"
+                     for entry in report["growth"])
+        return lines
+
+
+memory = MemoryTracker()
+
+if MEMORY:
+    memory.start()
+if ENABLED:
+    atexit.register(recorder.dump)
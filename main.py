@@ -1,35 +1,15 @@
 import flet as ft
+import dataclasses
 import datetime
-import math
-import sqlite3
-import os
-
-### DATABASE FUNCTIONS ###
-
-def connect_to_database(db_path):
-    return sqlite3.connect(db_path)
-
-def create_book_table(conn):
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS book (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            total_pages INTEGER NOT NULL,
-            read_pages INTEGER NOT NULL,
-            registered_date DATE NOT NULL,
-            target_date DATE NOT NULL,
-            finished BOOLEAN NOT NULL
-        )
-    """)
-    conn.commit()
+import threading
+import time
 
-def get_data(conn, table_name):
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT * FROM {table_name}")
-    columns = [column[0] for column in cursor.description]
-    data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-    return data
+from db.books import InvalidBook, validate_book
+from db.server import SERVER_MODE, SERVER_PORT, backups, manager, reader, syncer, writer
+from instrumentation import ENABLED as INSTRUMENTED, MEMORY, install_page, instrumented, memory, record, recorder
+from metrics import compute_metrics
+from render import batched, render
+from viewmodel import BookListModel, open_session, open_shared_session
 
 
 ### APP CLASS ###
@@ -74,7 +54,8 @@ class Register(ft.Container):
                 
         self.bt_register = ft.ElevatedButton(
             " YOMOU ",
-            on_click=self.register_book
+            on_click=self.register_book,
+            disabled=True,  # Enabled once the library is open
         )
 
         # Initialize the DatePicker button
@@ -128,10 +109,9 @@ class Register(ft.Container):
         target_date = self.value_dict["target_date"]
         
         if total_pages is not None and target_date is not None:
-            days_to_target = (target_date - datetime.date.today()).days
-            if days_to_target > 0:
-                daily_target = math.ceil((total_pages - read_pages) / days_to_target)
-                self.daily_target.value = f"{daily_target} pages/day"                
+            metrics = compute_metrics(total_pages, read_pages, target_date)
+            if metrics.daily_target is not None:
+                self.daily_target.value = f"{metrics.daily_target} pages/day"
             else:
                 print("Target date is today or in the past.")
         else:
@@ -140,6 +120,7 @@ class Register(ft.Container):
     def title_entered(self, e):
         self.value_dict["title"] = e.control.value if e.control.value else None
 
+    @batched
     def total_pages_entered(self, e):
         if e.control.value:
             try:
@@ -150,87 +131,146 @@ class Register(ft.Container):
                 self.value_dict["total_pages"] = None
         else:
             self.value_dict["total_pages"] = None
-        self.page.update()
+        render(self.page, self.daily_target)
                                     
+    @instrumented("ui.open_date_picker")
+    @batched
     def open_date_picker(self, e):
-        # Open the DatePicker
-        date_picker = ft.DatePicker(
-            first_date=datetime.date.today(),
-            last_date=datetime.date(2030, 12, 31),
-            on_change=self.date_changed,
-            on_dismiss=self.date_dismissed,
-        )
-        self.page.overlay.append(date_picker)
-        date_picker.open = True
-        self.page.update()
+        # Open the shared DatePicker
+        self.app.overlays.pick_date(self.date_changed, self.value_dict["target_date"])
 
-    def date_changed(self, e):
+    @batched
+    def date_changed(self, target_date):
         # Update the dictionary with the selected date from the DatePicker
-        target_date = e.control.value.date()  # Directly use the datetime object
         self.value_dict["target_date"] = target_date
 
         print(f"Target date value entered: {target_date}, days to the target date: {(target_date - datetime.date.today()).days}")
         self.calc_daily_target()
 
         self.target_date_button.content.content.controls[1].value = f"Finish by: {target_date.strftime('%Y-%m-%d')}"
-        # self.page.overlay.clear()
-        self.page.update()
-
-    def date_dismissed(self, e):
-        # Close the DatePicker when dismissed
-        self.page.overlay.clear()
-        self.page.update()
+        render(self.page, self.daily_target, self.target_date_button)
 
+    @instrumented("ui.register_book")
+    @batched
     def register_book(self, e):
-        # Validate that the book title and total pages are not blank
-        if not self.value_dict["title"] or self.value_dict["total_pages"] is None:
-            error_message = "Both 'Book title' and 'Total pages' are required."
+        # Same rules as the bulk import (db/transfer.py)
+        try:
+            title, total_pages, read_pages, target_date = validate_book(
+                self.value_dict["title"],
+                self.value_dict["total_pages"],
+                self.value_dict["read_pages"],
+                self.value_dict["target_date"],
+            )
+        except InvalidBook as e:
+            error_message = str(e)
             print(error_message)
-            self.page.snack_bar = ft.SnackBar(ft.Text(error_message), bgcolor=ft.Colors.ON_PRIMARY_CONTAINER)
-            self.page.snack_bar.open = True
-            self.page.update()
+            self.app.overlays.notify(error_message, bgcolor=ft.Colors.ON_PRIMARY_CONTAINER)
             return
 
-        # Construct the path to the database file
-        db_path = os.path.join(os.path.dirname(__file__), 'db', 'books.db')
-
-        # Connect to the database
-        conn = connect_to_database(db_path)
+        # Insert the book data into the database on the writer thread;
+        # the button stays disabled until the result arrives
+        self.bt_register.disabled = True
+        render(self.page, self.bt_register)
+        future = writer.submit(self.app.cache.insert, title, total_pages, read_pages, target_date)
+        future.add_done_callback(self.book_registered)
 
-        # Insert the book data into the database
-        cursor = conn.cursor()
+    @batched
+    def book_registered(self, future):
+        self.bt_register.disabled = False
         try:
-            cursor.execute(
-                """
-                INSERT INTO book (title, total_pages, read_pages, registered_date, target_date, finished)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    self.value_dict["title"],
-                    self.value_dict["total_pages"],
-                    self.value_dict["read_pages"],
-                    datetime.date.today(),
-                    self.value_dict["target_date"],
-                    False  # Initial finished status is False
-                )
-            )
-            conn.commit()
+            book = future.result()
             print("Book registered successfully.")
             # Optionally, provide user feedback
-            self.page.snack_bar = ft.SnackBar(
-                ft.Text("Book registered successfully!"),
-                duration=1000)
-            self.page.snack_bar.open = True
-            # Refresh the book list
-            self.app.book_list.update_book_list()
+            self.app.overlays.notify("Book registered successfully!", duration=1000)
+            # Add the new row to the book list, here and in the other sessions
+            self.app.book_list.insert_book(book)
+            self.app.book_list.publish("insert", book)
         except Exception as e:
             print(f"Error registering book: {e}")
             # Optionally, provide user feedback
-            self.page.snack_bar = ft.SnackBar(ft.Text(f"Error registering book: {e}"), bgcolor=ft.Colors.RED)
-            self.page.snack_bar.open = True
-        finally:
-            conn.close()
-        self.page.update()
+            self.app.overlays.notify(f"Error registering book: {e}", bgcolor=ft.Colors.RED)
+        render(self.page, self.bt_register)
+
+
+## Overlays
+# Dialogs and pickers live in page.overlay, and every entry there is part of
+# each page diff. Instead of appending a new control per click, one instance
+# of each is kept and reused, and closed entries beyond MAX_OVERLAY are
+# dropped, oldest first.
+class OverlayManager:
+    MAX_OVERLAY = 8
+    LAST_DATE = datetime.date(2030, 12, 31)  # Latest target date offered
+
+    def __init__(self, page):
+        self.page = page
+        self.instances = {}  # Key -> reused overlay control
+        self.on_date = None  # Receives the date picked in the shared DatePicker
+        self.date_picker = ft.DatePicker(
+            last_date=self.LAST_DATE,
+            on_change=self.date_changed,
+            on_dismiss=self.date_dismissed,
+        )
+        # One SnackBar for every message. A new one assigned to page.snack_bar
+        # per message stayed in the page for good, two more per book registered
+        # and deleted (found by bench/soak.py).
+        self.snack_bar = ft.SnackBar(ft.Text(""))
+
+    # The overlay control stored under key, built with factory() on first use
+    def get(self, key, factory):
+        if key not in self.instances:
+            self.instances[key] = factory()
+        return self.instances[key]
+
+    def show(self, control):
+        control.open = True
+        if control in self.page.overlay:
+            render(self.page, control)
+            return
+        self.page.overlay.append(control)
+        self.trim()
+        render(self.page)
+
+    def trim(self):
+        overlay = self.page.overlay
+        excess = len(overlay) - self.MAX_OVERLAY
+        for control in list(overlay):
+            if excess <= 0:
+                break
+            if not getattr(control, "open", False):
+                overlay.remove(control)
+                excess -= 1
+
+    # Open the shared DatePicker; on_date(date) is called with the picked date
+    def pick_date(self, on_date, value=None):
+        self.on_date = on_date
+        today = datetime.date.today()
+        # The picker must open on a selectable day. An overdue book's past target
+        # date opens on today; a target after LAST_DATE, which an import or a
+        # sync can bring, widens the range to it.
+        if value is not None:
+            value = max(value, today)
+        self.date_picker.first_date = today
+        self.date_picker.last_date = max(value, self.LAST_DATE) if value is not None else self.LAST_DATE
+        self.date_picker.value = value
+        self.show(self.date_picker)
+
+    @batched
+    def date_changed(self, e):
+        self.date_picker.open = False
+        on_date, self.on_date = self.on_date, None
+        if on_date is not None and e.control.value is not None:
+            on_date(e.control.value.date())
+
+    def date_dismissed(self, e):
+        self.date_picker.open = False
+        self.on_date = None
+
+    # Show a message in the shared SnackBar; one still showing gets the new text
+    def notify(self, message, bgcolor=None, duration=4000):
+        self.snack_bar.content.value = message
+        self.snack_bar.bgcolor = bgcolor
+        self.snack_bar.duration = duration
+        self.show(self.snack_bar)
 
 
 ## Book list - view, edit and delete
@@ -268,7 +308,7 @@ class ListText(ft.Text):
         )
 
 class DeleteConfirmationDialog(ft.AlertDialog):
-    def __init__(self, page, book, on_confirm):
+    def __init__(self, page, on_confirm):
         super().__init__(
             title=ft.Text("Delete Book"),
             content=ft.Text("Do you want to delete this book?"),
@@ -280,31 +320,34 @@ class DeleteConfirmationDialog(ft.AlertDialog):
         )
         self.page = page
 
+    @batched
     def close_dialog(self, e):
-        self.page.close(self)
-        self.page.update()
+        self.open = False
+        render(self.page, self)
 
+    @batched
     def confirm_and_close(self, on_confirm):
         on_confirm()
-        self.page.close(self)
-        self.page.update()
         self.close_dialog(None)
 
-# Dialog to edit or delete a book
+# Dialog to edit or delete a book. One instance per page is reused for every
+# book: bind() points it at the book to edit.
 class EditBookDialog(ft.AlertDialog):
-    def __init__(self, page, book, on_update, on_delete):
+    def __init__(self, page, overlays, on_update, on_delete):
         super().__init__(
             content_padding=ft.padding.symmetric(vertical=5, horizontal=15)
         )
         self.page = page
-        self.book = book
+        self.overlays = overlays
+        self.book = None
         self.on_update = on_update
         self.on_delete = on_delete
 
-        self.title_input = ft.TextField(label="Title", value=book["title"])
-        self.total_pages_input = ft.TextField(label="Total Pages", value=str(book["total_pages"]), keyboard_type=ft.KeyboardType.NUMBER)
-        self.read_pages_input = ft.TextField(label="Read Pages", value=str(book["read_pages"]), keyboard_type=ft.KeyboardType.NUMBER)
-        self.target_date = datetime.datetime.strptime(book["target_date"], "%Y-%m-%d").date()
+        self.title_input = ft.TextField(label="Title")
+        self.total_pages_input = ft.TextField(label="Total Pages", keyboard_type=ft.KeyboardType.NUMBER)
+        self.read_pages_input = ft.TextField(label="Read Pages", keyboard_type=ft.KeyboardType.NUMBER)
+        self.pace = ft.Text(size=12, color=ft.Colors.SECONDARY)
+        self.target_date = None
         self.target_date_button = ft.TextButton(
             content=ft.Row(
                 spacing=0,
@@ -312,7 +355,7 @@ class EditBookDialog(ft.AlertDialog):
                     ft.IconButton(
                         icon=ft.Icons.EDIT_CALENDAR,
                     ),
-                    ft.Text(f"Target Date: {self.target_date.strftime('%Y-%m-%d')}"),
+                    ft.Text(),
                 ]
             ),
             on_click=self.open_date_picker,
@@ -320,12 +363,11 @@ class EditBookDialog(ft.AlertDialog):
 
         self.confirmation_dialog = DeleteConfirmationDialog(
             self.page,
-            self.book,
             on_confirm=lambda: self.delete_book(),
         )
 
         self.content = ft.Column(
-            height=380,
+            height=400,
             spacing=15,
             controls=[
                 ft.Row(
@@ -343,6 +385,7 @@ class EditBookDialog(ft.AlertDialog):
                 self.title_input,
                 self.total_pages_input,
                 self.read_pages_input,
+                self.pace,
                 self.target_date_button,
                 ft.Row(
                     controls=[
@@ -350,7 +393,7 @@ class EditBookDialog(ft.AlertDialog):
                         ft.IconButton(
                             icon=ft.Icons.DELETE_FOREVER_ROUNDED,
                             tooltip="Delete book",
-                            on_click=lambda e: page.open(self.confirmation_dialog),
+                            on_click=lambda e: overlays.show(self.confirmation_dialog),
                             icon_color=ft.Colors.TERTIARY,
                         ),
                         ft.ElevatedButton("Update", tooltip="Update book", on_click=self.update_book),
@@ -361,58 +404,206 @@ class EditBookDialog(ft.AlertDialog):
             ]
         )
 
+    # Fill the inputs with another book's values
+    def bind(self, book):
+        self.book = book
+        self.title_input.value = book.title
+        self.total_pages_input.value = str(book.total_pages)
+        self.read_pages_input.value = str(book.read_pages)
+        self.show_target_date(book.target_date)
+        self.pace.value = ""  # Filled in by show_pace() once read
+
+    # Reading pace of the bound book, from the history rollups
+    @batched
+    def show_pace(self, book_id, pace):
+        if self.book is None or self.book.id != book_id:
+            return
+        if pace.last_read is None:
+            self.pace.value = "No reading logged yet"
+        else:
+            self.pace.value = (f"{pace.pages_per_day} pages/day this week"
+                               f" · {pace.streak} day streak · last read {pace.last_read.isoformat()}")
+        render(self.page, self.pace)
+
+    def show_target_date(self, target_date):
+        self.target_date = target_date
+        self.target_date_button.content.controls[1].value = f"Target Date: {target_date.strftime('%Y-%m-%d')}"
+
     # DatePicker for setting the new target date
+    @instrumented("ui.open_date_picker")
+    @batched
     def open_date_picker(self, e):
-        date_picker = ft.DatePicker(
-            first_date=datetime.date.today(),
-            last_date=datetime.date(2030, 12, 31),
-            on_change=self.date_changed,
-            on_dismiss=self.date_dismissed,
-        )
-        self.page.overlay.append(date_picker)
-        # date_picker.pick_date()
-        date_picker.open = True
-        self.page.update()
+        self.overlays.pick_date(self.date_changed, self.target_date)
         
-    def date_changed(self, e):
-        target_date = e.control.value.date()
-        self.target_date = target_date.strftime('%Y-%m-%d')
-        self.target_date_button.content.controls[1].value = f"Target Date: {self.target_date}"
-        self.update()
-        
-    def date_dismissed(self, e):
-        self.page.overlay.clear()
-        self.update()
-
+    @batched
+    def date_changed(self, target_date):
+        self.show_target_date(target_date)
+        render(self.page, self.target_date_button)
 
+    @batched
     def update_book(self, e):
-        self.book["title"] = self.title_input.value
-        self.book["total_pages"] = int(self.total_pages_input.value)
-        self.book["read_pages"] = int(self.read_pages_input.value)
-        self.book["target_date"] = self.target_date
-        self.on_update(self.book)
+        updated_book = dataclasses.replace(
+            self.book,
+            title=self.title_input.value,
+            total_pages=int(self.total_pages_input.value),
+            read_pages=int(self.read_pages_input.value),
+            target_date=self.target_date,
+        )
+        self.on_update(updated_book)
         self.close_dialog(e)
 
+    @batched
     def delete_book(self):
         self.on_delete(self.book)
         self.close_dialog(self)
 
+    @batched
     def close_dialog(self, e):
-        self.page.close(self)
+        self.open = False
+        render(self.page, self)
+
+
+# Day-by-day plan across the active books (see planner.py), with the daily
+# page budget it is built for
+class PlannerDialog(ft.AlertDialog):
+    PLAN_DAYS = 14  # Days listed
+    TITLES_PER_DAY = 3  # Books named per day; the rest are counted
+
+    def __init__(self, page, book_list):
+        super().__init__(title=ft.Text("Reading plan"))
+        self.page = page
+        self.book_list = book_list
+        self.budget_input = ft.TextField(
+            label="Daily budget",
+            suffix_text="pages",
+            width=160,
+            keyboard_type=ft.KeyboardType.NUMBER,
+            on_submit=self.budget_changed,
+            on_blur=self.budget_changed,
+        )
+        self.summary = ft.Text(size=13)
+        self.days = ft.Column(spacing=4)
+        self.content = ft.Column(
+            width=520,
+            tight=True,
+            scroll=ft.ScrollMode.AUTO,
+            controls=[self.budget_input, self.summary, ft.Divider(), self.days],
+        )
+        self.actions = [ft.TextButton("Close", on_click=lambda e: self.page.close(self))]
+
+    # Read the plan from the model; cheap enough to run after every change
+    def refresh(self):
+        model = self.book_list.model
+        with self.book_list.load_lock:
+            planner = model.plan()
+            summary = planner.summary()
+            days = planner.days(self.PLAN_DAYS)
+            budget = planner.budget
+        self.budget_input.value = str(budget)
+        self.budget_input.error_text = None
+        if summary.books == 0:
+            self.summary.value = "No active books to plan."
+        elif summary.late_books:
+            self.summary.value = (
+                f"{summary.late_books} of {summary.books} books would finish late."
+                f" {summary.needed_budget} pages/day would keep every book on time.")
+        else:
+            self.summary.value = (
+                f"All {summary.books} books finish on time"
+                f" ({summary.needed_budget} pages/day is enough).")
+        if summary.books:
+            self.summary.value += (f" {summary.remaining_pages} pages left,"
+                                   f" last target date {summary.last_target.isoformat()}.")
+        self.days.controls = [self.day_row(day) for day in days if day.pages]
+        render(self.page, self)
+
+    def day_row(self, day):
+        titles = []
+        for book_id, pages in day.pages[:self.TITLES_PER_DAY]:
+            book = self.book_list.cache.get(book_id)
+            titles.append(f"{book.title if book else '?'} ({pages})")
+        if len(day.pages) > self.TITLES_PER_DAY:
+            titles.append(f"+{len(day.pages) - self.TITLES_PER_DAY} more")
+        return ft.Row(controls=[
+            ft.Text(day.date.strftime("%a %m-%d"), size=12, width=70),
+            ft.Text(f"{sum(pages for _, pages in day.pages)} pages", size=12, width=70),
+            ft.Text(", ".join(titles), size=12, expand=True, no_wrap=True, overflow=ft.TextOverflow.ELLIPSIS),
+        ])
+
+    @batched
+    def budget_changed(self, e):
+        try:
+            budget = int(self.budget_input.value)
+            if budget < 1:
+                raise ValueError
+        except ValueError:
+            self.budget_input.error_text = "Whole number of pages"
+            render(self.page, self.budget_input)
+            return
+        with self.book_list.load_lock:
+            self.book_list.model.planner.budget = budget
+        self.refresh()
 
 
 # Main book list component
 class BookList(ft.Column):
-    def __init__(self, page):
+    ROW_HEIGHT = 40  # Fixed row height so the ListView can virtualize (item_extent)
+    PRELOAD_ROWS = 20  # Load the next batch when this close to the end of the list
+    SEARCH_DELAY = 0.15  # Seconds without typing before a search runs
+    CHANGES_TOPIC = "books"  # pubsub topic of the changes made by other sessions
+    SKELETON_ROWS = 8  # Placeholder rows shown until the library is open
+    MAX_SPARE_ROWS = 100  # Pooled row controls kept beyond those in the list
+    DAILY_TARGET_STYLE = ft.TextStyle(color=ft.Colors.SECONDARY, weight=ft.FontWeight.NORMAL, size=13)
+    OVERDUE_STYLE = ft.TextStyle(color=ft.Colors.TERTIARY, weight=ft.FontWeight.BOLD, size=13)
+    FINISHED_STYLE = ft.TextStyle(color=ft.Colors.PRIMARY, weight=ft.FontWeight.NORMAL, size=13)
+
+    def __init__(self, page, overlays):
         super().__init__(
             spacing=0,
-            scroll=ft.ScrollMode.AUTO,
+            expand=True,
         )
 
         self.page = page
-        self.book_list = ft.Column(spacing=0)
-        self.sort_by = "read_percentage"  # Default sorting criteria
-        self.sort_order = True  # True for ascending, False for descending
+        self.overlays = overlays
+        # Set by attach() once the library is open. Sorting, paging and formatting
+        # live in the model; this class only keeps the row controls in the same
+        # order as model.books.
+        self.cache = None
+        self.model = None
+        self.metrics = None
+        self.rows = {}  # Book id -> row control, for patching single rows
+        # Row controls are pooled: a refresh rebinds the rows already in the
+        # list to the new books, so control identities stay the same and the
+        # client diff only carries the texts that changed. Rows taken out of
+        # the list wait here to be reused.
+        self.spare_rows = []
+        # Only the rows in or near the viewport are built and sent to the client;
+        # further batches are appended as the user scrolls.
+        self.book_list = ft.ListView(
+            spacing=0,
+            expand=True,
+            item_extent=self.ROW_HEIGHT,
+            on_scroll=self.list_scrolled,
+            on_scroll_interval=50,
+            controls=[self.skeleton_row() for _ in range(self.SKELETON_ROWS)],
+        )
+        self.load_lock = threading.Lock()
+        # Search as you type: only the latest query counts; older ones are
+        # dropped from the DB queue or interrupted while they run
+        self.search_lock = threading.Lock()
+        self.search_generation = 0
+        self.search_timer = None
+        self.search_future = None
+        self.search_field = ft.TextField(
+            hint_text="Search titles",
+            prefix_icon=ft.Icons.SEARCH,
+            text_size=13,
+            height=36,
+            content_padding=ft.padding.symmetric(horizontal=7, vertical=0),
+            expand=True,
+            on_change=self.search_changed,
+            disabled=True,
+        )
 
         headers = ft.Row(
             controls=[
@@ -430,107 +621,522 @@ class BookList(ft.Column):
                 ft.Container(width=15),
             ],
         )
+        self.summary = ft.Text(size=12, color=ft.Colors.SECONDARY)
+        self.history_button = ft.IconButton(
+            icon=ft.Icons.BAR_CHART,
+            icon_size=17,
+            tooltip="Pages read per week",
+            on_click=self.open_history_dialog,
+            disabled=True,
+        )
+        # Status filter; "all" stands for no filter
+        self.status_filter = ft.SegmentedButton(
+            selected={"all"},
+            show_selected_icon=False,
+            segments=[
+                ft.Segment(value="all", label=ft.Text("All", size=12)),
+                ft.Segment(value="active", label=ft.Text("Active", size=12)),
+                ft.Segment(value="overdue", label=ft.Text("Overdue", size=12)),
+                ft.Segment(value="finished", label=ft.Text("Finished", size=12)),
+            ],
+            on_change=self.status_changed,
+            disabled=True,
+        )
+        self.planner_button = ft.IconButton(
+            icon=ft.Icons.EVENT_NOTE,
+            icon_size=17,
+            tooltip="Reading plan",
+            on_click=self.open_planner,
+            disabled=True,
+        )
+        self.backup_button = ft.IconButton(
+            icon=ft.Icons.BACKUP,
+            icon_size=17,
+            tooltip="Back up the library now",
+            on_click=self.backup_library,
+        )
+        summary_row = ft.Row(controls=[
+            self.search_field, self.summary, self.history_button, self.planner_button, self.backup_button,
+        ])
+        if syncer is not None:
+            self.sync_button = ft.IconButton(
+                icon=ft.Icons.SYNC,
+                icon_size=17,
+                tooltip="Sync with other devices",
+                on_click=self.sync_library,
+            )
+            summary_row.controls.append(self.sync_button)
+        if INSTRUMENTED:
+            summary_row.controls.append(ft.IconButton(
+                icon=ft.Icons.QUERY_STATS,
+                icon_size=17,
+                tooltip="Instrumentation",
+                on_click=self.open_stats_dialog,
+            ))
+        self.controls.append(summary_row)
+        self.controls.append(ft.Row(controls=[self.status_filter]))
         self.controls.append(headers)
         self.controls.append(self.book_list)
 
+    # Grey bar standing in for a row in the first frame
+    def skeleton_row(self):
+        return ft.Container(
+            height=self.ROW_HEIGHT,
+            padding=ft.padding.symmetric(vertical=12),
+            content=ft.Container(bgcolor=ft.Colors.SURFACE_CONTAINER_HIGHEST, border_radius=4),
+        )
+
+    # Replace the skeleton with the books once the library is open
+    def attach(self, cache):
+        self.cache = cache
+        self.model = BookListModel(cache)
+        self.metrics = self.model.metrics
+        self.search_field.disabled = False
+        self.history_button.disabled = False
+        self.planner_button.disabled = False
+        self.status_filter.disabled = False
         self.update_book_list()
+        self.metrics.schedule_midnight(self.refresh_metrics)
+        if SERVER_MODE:
+            self.page.pubsub.subscribe_topic(self.CHANGES_TOPIC, self.book_changed)
+
+    # The session is closed: stop the midnight timer and the pubsub
+    # subscription, which would otherwise keep this page and its library
+    # state alive until the process exits
+    def detach(self):
+        if self.metrics is not None:
+            self.metrics.stop()
+        if SERVER_MODE:
+            self.page.pubsub.unsubscribe_all()
+        self.cache = None
+        self.model = None
+        self.metrics = None
+        self.rows.clear()
+        self.spare_rows.clear()
 
+    # Redraw from the cache; no DB access
+    @instrumented("ui.update_book_list")
     def update_book_list(self):
-        self.book_list.controls.clear()
-
-        db_path = os.path.join(os.path.dirname(__file__), 'db', 'books.db')
-        conn = connect_to_database(db_path)
-        books = get_data(conn, "book")
-
-        if self.sort_by == "read_percentage":
-            books.sort(key=lambda book: (book["read_pages"] / book["total_pages"]) * 100,
-                       reverse=not self.sort_order)
-        elif self.sort_by == "target_date":
-            books.sort(key=lambda book: datetime.datetime.strptime(book["target_date"], "%Y-%m-%d").date(),
-                       reverse=not self.sort_order)
-
-        for book in books:
-            remaining_pages = book["total_pages"] - book["read_pages"]
-            read_percentage = round((book["read_pages"] / book["total_pages"]) * 100)
-
-            target_date = datetime.datetime.strptime(book["target_date"], "%Y-%m-%d").date()
-            days_to_target = (target_date - datetime.date.today()).days
-
-            if days_to_target > 0:
-                daily_target = math.ceil(remaining_pages / days_to_target)
-                daily_target_text = f"{daily_target} pages/day"
-                daily_target_color = ft.Colors.SECONDARY
-                daily_target_weight = ft.FontWeight.NORMAL
+        with self.load_lock:
+            books = self.model.reset()
+            # Skeleton rows are Containers and are dropped
+            old_rows = [control for control in self.book_list.controls if isinstance(control, ft.Row)]
+            self.rows.clear()
+            for row, book in zip(old_rows, books):
+                self.fill_row(row, book)
+            rows = old_rows[:len(books)]
+            rows.extend(self.take_row(book) for book in books[len(rows):])
+            for row in old_rows[len(books):]:
+                self.release_row(row)
+            self.book_list.controls = rows
+        self.summary.value = self.model.summary_text()
+        render(self.page, self)
+        self.refresh_planner()
+
+    @instrumented("ui.list_scrolled")
+    @batched
+    def list_scrolled(self, e):
+        if self.model is None or self.model.exhausted:
+            return
+        if e.pixels < e.max_scroll_extent - self.PRELOAD_ROWS * self.ROW_HEIGHT:
+            return
+        with self.load_lock:
+            if self.model.exhausted:
+                return
+            self.book_list.controls.extend(self.take_row(book) for book in self.model.load_more())
+        render(self.page, self.book_list)
+
+    # A row for `book`, reused from the pool when there is one
+    def take_row(self, book):
+        row = self.spare_rows.pop() if self.spare_rows else self.build_row()
+        self.fill_row(row, book)
+        return row
+
+    def release_row(self, row):
+        if len(self.spare_rows) < self.MAX_SPARE_ROWS:
+            self.spare_rows.append(row)
+
+    def build_row(self):
+        return ft.Row(
+            height=self.ROW_HEIGHT,
+            controls=[
+                ft.Container(expand=5, content=ListText("", weight=ft.FontWeight.BOLD, size=14)),
+                ft.Container(expand=2, content=ListText("")),
+                ft.Container(expand=3, content=ListText("")),
+                ft.Container(expand=4, content=ListText("")),
+                ft.Container(width=15, content=ft.IconButton(
+                    icon=ft.Icons.EDIT,
+                    icon_size=17,
+                    padding=ft.padding.all(0),
+                    tooltip="Edit or Delete Book",
+                    on_click=self.edit_clicked,
+                )),
+            ]
+        )
+
+    # Write the book's values into an existing row. Rows and their edit
+    # buttons only hold the book id; the book itself is looked up on click.
+    def fill_row(self, row, book):
+        view = self.model.row_view(book)
+        title, percentage, date, daily = (container.content for container in row.controls[:4])
+        title.value = view.title
+        percentage.value = view.read_percentage
+        date.value = view.target_date
+        daily.value = view.daily_target
+        if view.finished:
+            daily.style = self.FINISHED_STYLE
+        else:
+            daily.style = self.OVERDUE_STYLE if view.overdue else self.DAILY_TARGET_STYLE
+        if row.data != book.id:
+            row.opacity = None  # A pending write of the previous book no longer applies
+            row.data = book.id
+            row.controls[4].content.data = book.id
+        self.rows[book.id] = row
+
+    # Shared click handler of every row's edit button
+    def edit_clicked(self, e):
+        book = self.cache.get(e.control.data)
+        if book is not None:
+            self.open_edit_dialog(book)
+
+    @instrumented("ui.insert_book")
+    def insert_book(self, book):
+        with self.load_lock:
+            position = self.model.insert(book)
+            if position is not None:
+                self.book_list.controls.insert(position, self.take_row(book))
+        self.summary.value = self.model.summary_text()
+        if position is not None:
+            render(self.page, self.book_list)
+        render(self.page, self.summary)
+        self.refresh_planner()
+        if self.model.searching:
+            self.refresh_search()
+
+    @instrumented("ui.patch_book")
+    def patch_book(self, book):
+        with self.load_lock:
+            old_index, new_index = self.model.update(book)
+            row = self.rows.pop(book.id, None)
+            changed_control = None
+            if old_index is not None and old_index == new_index:
+                # Same position: only the row's texts are sent
+                self.fill_row(row, book)
+                changed_control = row
             else:
-                daily_target_text = "Target date passed"
-                daily_target_color = ft.Colors.TERTIARY
-                daily_target_weight = ft.FontWeight.BOLD
+                if old_index is not None:
+                    self.book_list.controls.pop(old_index)
+                    changed_control = self.book_list
+                if new_index is not None:
+                    if row is None:
+                        row = self.take_row(book)
+                    else:
+                        self.fill_row(row, book)
+                    self.book_list.controls.insert(new_index, row)
+                    changed_control = self.book_list
+                elif row is not None:
+                    self.release_row(row)
+        self.summary.value = self.model.summary_text()
+        if changed_control is not None:
+            render(self.page, changed_control)
+        render(self.page, self.summary)
+        self.refresh_planner()
+        if self.model.searching:
+            self.refresh_search()
 
-            book_entry = ft.Row(
-                controls=[
-                    ft.Container(expand=5, content=ListText(book["title"], weight=ft.FontWeight.BOLD, size=14)),
-                    ft.Container(expand=2, content=ListText(f'{read_percentage} %')),
-                    ft.Container(expand=3, content=ListText(target_date)),
-                    ft.Container(expand=4, content=ListText(daily_target_text, daily_target_color, daily_target_weight)),
-                    ft.Container(width=15, content=ft.IconButton(
-                        icon=ft.Icons.EDIT,
-                        icon_size=17,
-                        padding=ft.padding.all(0),
-                        tooltip="Edit or Delete Book",
-                        on_click=lambda e, book=book: self.open_edit_dialog(book)
-                    )),
-                ]
-            )
-            self.book_list.controls.append(book_entry)
+    @instrumented("ui.remove_book")
+    def remove_book(self, book_id):
+        with self.load_lock:
+            index = self.model.remove(book_id)
+            if index is not None:
+                self.release_row(self.book_list.controls.pop(index))
+                del self.rows[book_id]
+        self.summary.value = self.model.summary_text()
+        if index is not None:
+            render(self.page, self.book_list)
+        render(self.page, self.summary)
+        self.refresh_planner()
+        if self.model.searching:
+            self.refresh_search()
 
-        conn.close()
-        self.page.update()
+    # Tell the other sessions about a change this session made (server mode).
+    # They share the cache, so the message only says which rows to redraw.
+    def publish(self, change, value):
+        if SERVER_MODE:
+            self.page.pubsub.send_others_on_topic(self.CHANGES_TOPIC, (change, value))
 
+    @batched
+    def book_changed(self, topic, message):
+        if self.model is None:
+            return
+        change, value = message
+        if change == "insert":
+            # Already shown if this session loaded it from the shared cache first
+            if value.id in self.rows:
+                self.patch_book(value)
+            else:
+                self.insert_book(value)
+        elif change == "update":
+            self.patch_book(value)
+        elif change == "delete":
+            self.remove_book(value)
+
+    # Called after midnight: days left, daily targets and the
+    # "Target date passed" state change for every loaded row
+    @batched
+    def refresh_metrics(self):
+        if self.model is None:
+            return
+        if self.model.status in ("active", "overdue"):
+            # Books whose target date just passed move from active to overdue
+            self.update_book_list()
+            return
+        with self.load_lock:
+            for book_id, row in self.rows.items():
+                self.fill_row(row, self.model.loaded[book_id])
+        self.summary.value = self.model.summary_text()
+        render(self.page, self.book_list, self.summary)
+
+    # Check on the DB thread whether another connection changed the table,
+    # and redraw only if it did. Runs on the writer: PRAGMA data_version
+    # ignores the commits of the connection asking, which must be the writer's.
+    def reload_if_changed(self):
+        future = writer.submit(self.cache.refresh_if_changed)
+        future.add_done_callback(self.table_checked)
+
+    @batched
+    def table_checked(self, future):
+        if future.exception() is None and future.result():
+            if self.model.searching:
+                self.refresh_search()
+            else:
+                self.update_book_list()
+
+    # Debounce: every keystroke restarts the timer
+    @instrumented("ui.search_changed")
+    def search_changed(self, e):
+        with self.search_lock:
+            self.search_generation += 1
+            if self.search_timer is not None:
+                self.search_timer.cancel()
+            self.search_timer = threading.Timer(
+                self.SEARCH_DELAY, self.run_search, (e.control.value, self.search_generation))
+            self.search_timer.daemon = True
+            self.search_timer.start()
+
+    # Search again for the current text, e.g. after a book was changed
+    def refresh_search(self):
+        with self.search_lock:
+            self.search_generation += 1
+            generation = self.search_generation
+        self.run_search(self.model.query, generation)
+
+    def run_search(self, text, generation):
+        def superseded():
+            return generation != self.search_generation
+
+        with self.search_lock:
+            if superseded():
+                return
+            if self.search_future is not None:
+                # Still queued behind other DB work: it will never run
+                self.search_future.cancel()
+            self.search_future = reader.submit(self.cache.search, text, superseded)
+        self.search_future.add_done_callback(lambda f: self.search_done(f, text, superseded))
+
+    @batched
+    def search_done(self, future, text, superseded):
+        # A superseded search was interrupted or its result is stale
+        if future.cancelled() or superseded():
+            return
+        if future.exception() is not None:
+            self.show_error(f"Error searching books: {future.exception()}")
+            return
+        self.model.set_matches(text, future.result())
+        self.update_book_list()
+
+    @instrumented("ui.status_changed")
+    @batched
+    def status_changed(self, e):
+        if self.model is None:
+            return
+        status = next(iter(e.control.selected), "all")
+        self.model.set_status(None if status == "all" else status)
+        self.update_book_list()
+
+    @instrumented("ui.sort_by_read_percentage")
+    @batched
     def sort_by_read_percentage(self, e):
-        self.sort_by = "read_percentage"
-        self.sort_order = not self.sort_order
+        if self.model is None:
+            return
+        self.model.toggle_sort("read_percentage")
         self.update_book_list()
+        self.reload_if_changed()
 
+    @instrumented("ui.sort_by_target_date")
+    @batched
     def sort_by_target_date(self, e):
-        self.sort_by = "target_date"
-        self.sort_order = not self.sort_order
+        if self.model is None:
+            return
+        self.model.toggle_sort("target_date")
         self.update_book_list()
+        self.reload_if_changed()
 
-    def open_edit_dialog(self, book):
-        def on_update(updated_book):
-            db_path = os.path.join(os.path.dirname(__file__), 'db', 'books.db')
-            conn = connect_to_database(db_path)
-
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE book
-                SET title = ?, total_pages = ?, read_pages = ?, target_date = ?
-                WHERE id = ?
-            """, (updated_book["title"], updated_book["total_pages"], updated_book["read_pages"], updated_book["target_date"], updated_book["id"]))
-            conn.commit()
-            conn.close()
+    # Dim a row while its write is queued or running
+    def set_pending(self, book_id, pending):
+        row = self.rows.get(book_id)
+        if row is not None:
+            row.opacity = 0.5 if pending else None
+            render(self.page, row)
 
-            self.update_book_list()
+    def show_error(self, message):
+        print(message)
+        self.overlays.notify(message, bgcolor=ft.Colors.RED)
 
-        def on_delete(book_to_delete):
-            db_path = os.path.join(os.path.dirname(__file__), 'db', 'books.db')
-            conn = connect_to_database(db_path)
+    # Latency histograms recorded so far (YOMOU_INSTRUMENT=1), and with
+    # YOMOU_INSTRUMENT_MEMORY=1 live controls and memory growth
+    @batched
+    def open_stats_dialog(self, e):
+        dialog = self.overlays.get("stats", lambda: ft.AlertDialog(
+            title=ft.Text("Instrumentation"),
+            content=ft.Column(width=500, scroll=ft.ScrollMode.AUTO),
+            actions=[ft.TextButton("Close", on_click=lambda e: self.page.close(dialog))],
+        ))
+        lines = recorder.report_lines()
+        if MEMORY:
+            # Memory growth since the previous readout, or since startup
+            lines = memory.report_lines() + lines
+            memory.reset()
+        dialog.content.controls = ([ft.Text(line, size=12, selectable=True) for line in lines]
+                                   or [ft.Text("Nothing recorded yet.")])
+        self.overlays.show(dialog)
 
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM book WHERE id = ?", (book_to_delete["id"],))
-            conn.commit()
-            conn.close()
+    # Pages read per week, from the weekly rollup
+    @instrumented("ui.open_history_dialog")
+    def open_history_dialog(self, e):
+        reader.submit(self.cache.weekly_pages).add_done_callback(self.history_loaded)
 
-            self.update_book_list()
+    @batched
+    def history_loaded(self, future):
+        if future.exception() is not None:
+            self.show_error(f"Error reading history: {future.exception()}")
+            return
+        weeks = future.result()
+        most = max((week.pages for week in weeks), default=0) or 1
+        dialog = self.overlays.get("history", lambda: ft.AlertDialog(
+            title=ft.Text("Pages read per week"),
+            content=ft.Column(width=400, tight=True),
+            actions=[ft.TextButton("Close", on_click=lambda e: self.page.close(dialog))],
+        ))
+        dialog.content.controls = [
+            ft.Row(controls=[
+                ft.Text(week.week.isoformat(), size=12, width=80),
+                ft.ProgressBar(value=max(week.pages, 0) / most, expand=True),
+                ft.Text(f"{week.pages}", size=12, width=50, text_align=ft.TextAlign.RIGHT),
+            ])
+            for week in weeks
+        ]
+        self.overlays.show(dialog)
+
+    # On-demand snapshot (db/backup.py); runs on the backup thread, the app
+    # keeps reading and writing meanwhile
+    @batched
+    def backup_library(self, e):
+        self.backup_button.disabled = True
+        render(self.page, self.backup_button)
+        backups.backup_now().add_done_callback(self.backup_done)
+
+    @batched
+    def backup_done(self, future):
+        self.backup_button.disabled = False
+        render(self.page, self.backup_button)
+        if future.exception() is not None:
+            self.show_error(f"Error backing up the library: {future.exception()}")
+            return
+        self.overlays.notify(f"Library backed up to {future.result()}", duration=2000)
+
+    # Exchange changes with other devices (db/sync.py) on the sync thread, then
+    # reload if any of theirs were applied
+    @instrumented("ui.sync_library")
+    @batched
+    def sync_library(self, e):
+        self.sync_button.disabled = True
+        render(self.page, self.sync_button)
+        syncer.sync_now().add_done_callback(self.sync_done)
+
+    @batched
+    def sync_done(self, future):
+        self.sync_button.disabled = False
+        render(self.page, self.sync_button)
+        if future.exception() is not None:
+            self.show_error(f"Error syncing the library: {future.exception()}")
+            return
+        result = future.result()
+        if result.applied:
+            self.reload_if_changed()
+        self.overlays.notify(f"Synced: {result.sent} changes sent, {result.received} received.", duration=2000)
+
+    @instrumented("ui.open_planner")
+    @batched
+    def open_planner(self, e):
+        dialog = self.overlays.get("planner", lambda: PlannerDialog(self.page, self))
+        dialog.refresh()
+        self.overlays.show(dialog)
+
+    # Keep an open planner in step with the list
+    def refresh_planner(self):
+        dialog = self.overlays.instances.get("planner")
+        if dialog is not None and dialog.open:
+            dialog.refresh()
+
+    @instrumented("ui.update_book")
+    def save_book(self, updated_book):
+        self.set_pending(updated_book.id, True)
+        future = writer.submit(self.cache.update, updated_book)
+        future.add_done_callback(lambda f: self.book_saved(f, updated_book.id))
+
+    @batched
+    def book_saved(self, future, book_id):
+        row = self.rows.get(book_id)
+        if row is not None:
+            row.opacity = None
+        try:
+            saved_book = future.result()
+        except Exception as e:
+            self.set_pending(book_id, False)
+            self.show_error(f"Error updating book: {e}")
+            return
+        self.patch_book(saved_book)
+        self.publish("update", saved_book)
+
+    @instrumented("ui.delete_book")
+    def delete_book(self, book_to_delete):
+        self.set_pending(book_to_delete.id, True)
+        future = writer.submit(self.cache.delete, book_to_delete.id)
+        future.add_done_callback(lambda f: self.book_deleted(f, book_to_delete))
+
+    @batched
+    def book_deleted(self, future, book_to_delete):
+        try:
+            future.result()
+        except Exception as e:
+            self.set_pending(book_to_delete.id, False)
+            self.show_error(f"Error deleting book: {e}")
+            return
+        self.remove_book(book_to_delete.id)
+        self.publish("delete", book_to_delete.id)
 
-            self.page.snack_bar = ft.SnackBar(ft.Text(f"Deleted book: '{book_to_delete['title']}'"), bgcolor=ft.Colors.ON_PRIMARY_CONTAINER)
-            self.page.snack_bar.open = True
-            self.page.update()
+        self.overlays.notify(f"Deleted book: '{book_to_delete.title}'", bgcolor=ft.Colors.ON_PRIMARY_CONTAINER)
 
-        dialog = EditBookDialog(self.page, book, on_update, on_delete)
-        self.page.overlay.append(dialog)
-        dialog.open = True
-        self.page.update()
+    @instrumented("ui.open_edit_dialog")
+    @batched
+    def open_edit_dialog(self, book):
+        dialog = self.overlays.get(
+            "edit_book", lambda: EditBookDialog(self.page, self.overlays, self.save_book, self.delete_book))
+        dialog.bind(book)
+        self.overlays.show(dialog)
+        future = reader.submit(self.cache.book_pace, book.id)
+        future.add_done_callback(lambda f: f.exception() is None and dialog.show_pace(book.id, f.result()))
 
 ## Yomou              
 class Yomou(ft.Column):
@@ -540,29 +1146,77 @@ class Yomou(ft.Column):
         )
         
         self.page = page
+        self.cache = None  # Set by session_opened()
+        self.closed = False
+        self.overlays = OverlayManager(page)
         self.register = Register(self)
-        self.book_list = BookList(page)
+        self.book_list = BookList(page, self.overlays)
         
         self.controls = [
             self.register,
             self.book_list,
         ]
 
+    @batched
+    def session_opened(self, future):
+        try:
+            self.cache = future.result()
+        except Exception as e:
+            self.book_list.show_error(f"Error opening the library: {e}")
+            return
+        if self.closed:
+            return
+        self.register.bt_register.disabled = False
+        render(self.page, self.register.bt_register)
+        self.book_list.attach(self.cache)
+
+    def close(self):
+        self.closed = True
+        self.book_list.detach()
+
+# Schema check and cache load; runs on a DB thread after the first frame
+def load_session():
+    if SERVER_MODE:
+        cache = open_shared_session(manager, writer)
+        # A failed group commit leaves the shared cache ahead of the DB
+        writer.on_rollback = cache.load
+        return cache
+    return open_session(manager)
+
         
 ### MAIN ###
 def main(page: ft.Page):
+    started = time.perf_counter()
     page.window.width = 600
     page.window.height = 800
     page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
     page.theme = ft.Theme(color_scheme_seed="light_blue")
     page.padding = 20
+    install_page(page)
 
-    db_path = os.path.join(os.path.dirname(__file__), 'db', 'books.db')
-    conn = connect_to_database(db_path)
-    create_book_table(conn)
-    conn.close()
-
+    # First frame: the Register panel and a skeleton of the list. The library
+    # is opened afterwards, so its size does not delay the window.
     app = Yomou(page)
-    page.add(ft.SafeArea(app))
+    # Server mode: Flet closes a session some time after its browser tab is
+    # gone (a dropped connection alone may still come back)
+    page.on_close = lambda e: app.close()
+    page.add(ft.SafeArea(app, expand=True))
+    first_frame_ms = (time.perf_counter() - started) * 1000
+
+    def session_opened(future):
+        app.session_opened(future)
+        book_list_ms = (time.perf_counter() - started) * 1000
+        print(f"First frame after {first_frame_ms:.0f} ms, book list after {book_list_ms:.0f} ms.")
+        record("startup.first_frame", first_frame_ms)
+        record("startup.book_list", book_list_ms)
+
+    reader.submit(load_session).add_done_callback(session_opened)
+    backups.schedule()
 
-ft.app(main)
\ No newline at end of file
+if __name__ == "__main__":
+    if SERVER_MODE:
+        ft.app(main, view=ft.AppView.WEB_BROWSER, port=SERVER_PORT)
+    else:
+        ft.app(main)
+    # Close the shared connection once the window is gone
+    manager.close()
\ No newline at end of file
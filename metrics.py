@@ -0,0 +1,200 @@
+import datetime
+import math
+import threading
+from collections import namedtuple
+
+# NumPy is optional, and importing it takes ~100 ms, so it is imported when
+# metrics are first computed in bulk rather than at startup
+_np = False  # Not imported yet; None once it turned out to be missing
+
+def numpy():
+    global _np
+    if _np is False:
+        try:
+            import numpy as np
+        except ImportError:  # Fall back to the per-book path
+            np = None
+        _np = np
+    return _np
+
+# daily_target is None once the target date is today or in the past
+Metrics = namedtuple("Metrics", ["read_percentage", "remaining_pages", "days_to_target", "daily_target"])
+
+def compute_metrics(total_pages, read_pages, target_date, today=None):
+    today = today or datetime.date.today()
+    remaining_pages = total_pages - read_pages
+    read_percentage = round(read_pages / total_pages * 100) if total_pages else 0
+    days_to_target = (target_date - today).days
+    daily_target = math.ceil(remaining_pages / days_to_target) if days_to_target > 0 else None
+    return Metrics(read_percentage, remaining_pages, days_to_target, daily_target)
+
+# Aggregates over the whole library.
+# Active books have pages left and a future target date; overdue ones have pages left and a passed date.
+Summary = namedtuple("Summary", ["active_books", "daily_pages", "remaining_pages", "overdue_books"])
+
+def _columns(books, today):
+    np = numpy()
+    total_pages = np.fromiter((book.total_pages for book in books), dtype=np.int64, count=len(books))
+    read_pages = np.fromiter((book.read_pages for book in books), dtype=np.int64, count=len(books))
+    target_days = np.array([book.target_date for book in books], dtype="datetime64[D]").astype(np.int64)
+    today_days = np.datetime64(today, "D").astype(np.int64)
+
+    remaining_pages = total_pages - read_pages
+    read_percentage = np.round(read_pages / np.where(total_pages == 0, 1, total_pages) * 100).astype(np.int64)
+    read_percentage[total_pages == 0] = 0
+    days_to_target = target_days - today_days
+    ahead = days_to_target > 0
+    # Integer ceil division, same result as math.ceil(remaining / days)
+    daily_target = -(-remaining_pages // np.where(ahead, days_to_target, 1))
+    return read_percentage, remaining_pages, days_to_target, daily_target, ahead
+
+# Metrics for many books at once: one NumPy pass instead of a Python loop.
+# Returns a Metrics of lists aligned with `books`.
+def bulk_metrics(books, today=None):
+    today = today or datetime.date.today()
+    if not books:
+        return Metrics([], [], [], [])
+    if numpy() is None:
+        rows = [compute_metrics(book.total_pages, book.read_pages, book.target_date, today)
+                for book in books]
+        return Metrics(*(list(column) for column in zip(*rows)))
+
+    read_percentage, remaining_pages, days_to_target, daily_target, ahead = _columns(books, today)
+    return Metrics(
+        read_percentage.tolist(),
+        remaining_pages.tolist(),
+        days_to_target.tolist(),
+        [target if is_ahead else None for target, is_ahead in zip(daily_target.tolist(), ahead.tolist())],
+    )
+
+def library_summary(books, today=None):
+    today = today or datetime.date.today()
+    books = list(books)
+    if not books:
+        return Summary(0, 0, 0, 0)
+    if numpy() is not None:
+        _, remaining_pages, _, daily_target, ahead = _columns(books, today)
+        unfinished = remaining_pages > 0
+        active = unfinished & ahead
+        return Summary(int(active.sum()), int(daily_target[active].sum()),
+                       int(remaining_pages[unfinished].sum()), int((unfinished & ~ahead).sum()))
+
+    totals = [0, 0, 0, 0]
+    for book in books:
+        metrics = compute_metrics(book.total_pages, book.read_pages, book.target_date, today)
+        for i, value in enumerate(book_summary(metrics)):
+            totals[i] += value
+    return Summary(*totals)
+
+# A single book's contribution to the library Summary
+def book_summary(metrics):
+    if metrics.remaining_pages <= 0:
+        return Summary(0, 0, 0, 0)
+    if metrics.daily_target is None:
+        return Summary(0, 0, metrics.remaining_pages, 1)
+    return Summary(1, metrics.daily_target, metrics.remaining_pages, 0)
+
+
+# Library Summary kept current one book at a time: a full vectorized pass on
+# rebuild(), then replace() subtracts a book's old contribution and adds the new one.
+class LibraryTotals:
+    def __init__(self):
+        self.inputs = {}  # Book id -> (total_pages, read_pages, target_date)
+        self.summary = Summary(0, 0, 0, 0)
+        self.today = None
+
+    def rebuild(self, books, today):
+        books = list(books)
+        self.today = today
+        self.summary = library_summary(books, today)
+        self.inputs = {book.id: (book.total_pages, book.read_pages, book.target_date) for book in books}
+
+    # book is None when the book was deleted
+    def replace(self, book_id, book):
+        old = self.inputs.pop(book_id, None)
+        totals = list(self.summary)
+        if old is not None:
+            for i, value in enumerate(book_summary(compute_metrics(*old, self.today))):
+                totals[i] -= value
+        if book is not None:
+            new = (book.total_pages, book.read_pages, book.target_date)
+            self.inputs[book_id] = new
+            for i, value in enumerate(book_summary(compute_metrics(*new, self.today))):
+                totals[i] += value
+        self.summary = Summary(*totals)
+
+def seconds_until_midnight(now=None):
+    now = now or datetime.datetime.now()
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return (midnight - now).total_seconds()
+
+
+# Memoized per-book metrics. A book is recomputed only when its pages or
+# target date change, or when the calendar day rolls over.
+class MetricsEngine:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.today = datetime.date.today()
+        self.memo = {}  # Book id -> ((total_pages, read_pages, target_date), Metrics)
+        self.timer = None
+        self.on_rollover = None
+
+    def get(self, book):
+        inputs = (book.total_pages, book.read_pages, book.target_date)
+        with self.lock:
+            cached = self.memo.get(book.id)
+            if cached is not None and cached[0] == inputs:
+                return cached[1]
+            metrics = compute_metrics(*inputs, self.today)
+            self.memo[book.id] = (inputs, metrics)
+            return metrics
+
+    # Fill the memo for a batch of books in one vectorized pass
+    def prime(self, books):
+        with self.lock:
+            stale = [book for book in books
+                     if self.memo.get(book.id, (None,))[0] != (book.total_pages, book.read_pages, book.target_date)]
+            if not stale:
+                return
+            columns = bulk_metrics(stale, self.today)
+            for book, metrics in zip(stale, zip(*columns)):
+                inputs = (book.total_pages, book.read_pages, book.target_date)
+                self.memo[book.id] = (inputs, Metrics(*metrics))
+
+    def forget(self, book_id):
+        with self.lock:
+            self.memo.pop(book_id, None)
+
+    def roll_over(self):
+        with self.lock:
+            self.today = datetime.date.today()
+            self.memo.clear()
+
+    # Call on_rollover() right after every local midnight
+    def schedule_midnight(self, on_rollover):
+        self.on_rollover = on_rollover
+        self._start_timer()
+
+    def _start_timer(self):
+        # A second of slack so the timer never fires just before midnight
+        self.timer = threading.Timer(seconds_until_midnight() + 1, self._midnight)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _midnight(self):
+        self.roll_over()
+        on_rollover = self.on_rollover
+        if on_rollover is None:  # Stopped
+            return
+        try:
+            on_rollover()
+        except Exception as e:
+            print(f"Error refreshing metrics at midnight: {e}")
+        if self.on_rollover is not None:
+            self._start_timer()
+
+    def stop(self):
+        self.on_rollover = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
@@ -0,0 +1,124 @@
+import bisect
+import datetime
+import math
+import os
+from collections import namedtuple
+
+# Pages the planner may schedule per day, until changed in the planner dialog
+DAILY_BUDGET = int(os.environ.get("YOMOU_DAILY_BUDGET", "50"))
+
+# finish_date is the day the last page is scheduled; late when that is not
+# before the target date (the same days compute_metrics counts)
+BookPlan = namedtuple("BookPlan", ["book_id", "finish_date", "target_date", "late"])
+# pages is a list of (book id, pages) in reading order
+DayPlan = namedtuple("DayPlan", ["date", "pages"])
+# needed_budget is the smallest daily budget that keeps every book on time
+PlanSummary = namedtuple("PlanSummary", ["books", "remaining_pages", "late_books", "needed_budget", "last_target"])
+
+
+# Day-by-day reading plan across the active books (unfinished, target date
+# ahead), earliest deadline first: each day's budget goes to the book due
+# soonest, then the next. With the same budget every day, that schedule is the
+# books in deadline order laid end to end over a line of pages, cut into
+# budget-sized days. So the plan is a sorted list plus running totals of the
+# remaining pages: a book's last page falls on day (running total - 1) // budget.
+#
+# Kept current one book at a time like LibraryTotals: replace() moves a single
+# entry in the sorted list and only the running totals from its position on are
+# summed again, when next needed. Changing the budget needs no recomputation at all.
+class Planner:
+    def __init__(self, budget=DAILY_BUDGET):
+        self.budget = budget
+        self.today = None
+        self.keys = []  # (target_date, id) of the planned books, in deadline order
+        self.remaining = []  # Pages left, aligned with keys
+        self.totals = []  # Running totals of remaining; current up to self.valid
+        self.valid = 0
+        self.planned = {}  # Book id -> its key
+
+    def rebuild(self, books, today):
+        self.today = today
+        entries = sorted(((book.target_date, book.id), book.total_pages - book.read_pages)
+                         for book in books if self.plans(book))
+        self.keys = [key for key, _ in entries]
+        self.remaining = [remaining for _, remaining in entries]
+        self.planned = {key[1]: key for key in self.keys}
+        self.totals = []
+        self.valid = 0
+
+    def plans(self, book):
+        return not book.finished and book.read_pages < book.total_pages and book.target_date > self.today
+
+    # book is None when the book was deleted
+    def replace(self, book_id, book):
+        if self.today is None:
+            return  # Not built yet; rebuild() will see the change
+        key = self.planned.pop(book_id, None)
+        if key is not None:
+            index = bisect.bisect_left(self.keys, key)
+            del self.keys[index]
+            del self.remaining[index]
+            self.valid = min(self.valid, index)
+        if book is not None and self.plans(book):
+            key = (book.target_date, book.id)
+            index = bisect.bisect_left(self.keys, key)
+            self.keys.insert(index, key)
+            self.remaining.insert(index, book.total_pages - book.read_pages)
+            self.planned[book_id] = key
+            self.valid = min(self.valid, index)
+
+    def _running_totals(self):
+        if self.valid < len(self.keys) or len(self.totals) != len(self.keys):
+            del self.totals[self.valid:]
+            total = self.totals[-1] if self.totals else 0
+            for remaining in self.remaining[self.valid:]:
+                total += remaining
+                self.totals.append(total)
+            self.valid = len(self.keys)
+        return self.totals
+
+    def _day_of_page(self, page):
+        return self.today + datetime.timedelta(days=page // self.budget)
+
+    def book_plan(self, book_id):
+        key = self.planned.get(book_id)
+        if key is None:
+            return None
+        totals = self._running_totals()
+        index = bisect.bisect_left(self.keys, key)
+        finish_date = self._day_of_page(totals[index] - 1)
+        return BookPlan(book_id, finish_date, key[0], finish_date >= key[0])
+
+    # The reading of `count` days from `start` (default today). Each day is
+    # found by bisecting the running totals, whatever the size of the library.
+    def days(self, count, start=None):
+        totals = self._running_totals()
+        first = ((start or self.today) - self.today).days
+        plan = []
+        for offset in range(first, first + count):
+            begin, end = offset * self.budget, (offset + 1) * self.budget
+            pages = []
+            index = bisect.bisect_right(totals, begin)
+            while index < len(totals) and (totals[index - 1] if index else 0) < end:
+                book_begin = totals[index - 1] if index else 0
+                pages.append((self.keys[index][1], min(end, totals[index]) - max(begin, book_begin)))
+                index += 1
+            plan.append(DayPlan(self.today + datetime.timedelta(days=offset), pages))
+        return plan
+
+    def summary(self):
+        totals = self._running_totals()
+        late_books = 0
+        needed_budget = 0
+        for (target_date, _), total in zip(self.keys, totals):
+            days = (target_date - self.today).days
+            if (total - 1) // self.budget >= days:
+                late_books += 1
+            needed_budget = max(needed_budget, math.ceil(total / days))
+        return PlanSummary(
+            books=len(self.keys),
+            remaining_pages=totals[-1] if totals else 0,
+            late_books=late_books,
+            needed_budget=needed_budget,
+            last_target=self.keys[-1][0] if self.keys else None,
+        )
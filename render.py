@@ -0,0 +1,114 @@
+import functools
+import threading
+import weakref
+from contextlib import contextmanager
+
+# Coalesced rendering. Handlers mark the controls they changed with
+# render(page, *controls) instead of calling update() themselves; the
+# scheduler sends all of them in one page.update() on the next tick of the
+# page's event loop. Inside a @batched handler nothing is sent until the
+# handler returns, so one user action produces a single diff however many
+# helpers it goes through.
+class RenderScheduler:
+    def __init__(self, page):
+        # Weak, so that `schedulers` lets go of the page once its session is gone
+        self.page_ref = weakref.ref(page)
+        self.lock = threading.Lock()
+        self.dirty = {}  # id(control) -> control, in the order they were marked
+        self.whole_page = False
+        self.holds = 0  # Open batches; the flush waits until they are all closed
+        self.scheduled = False
+
+    # Mark controls for the next flush; no controls means the whole page
+    def mark(self, *controls):
+        with self.lock:
+            if not controls:
+                self.whole_page = True
+            for control in controls:
+                self.dirty[id(control)] = control
+            flush_now = self.holds == 0 and self._schedule()
+        if flush_now:
+            self.flush()
+
+    @contextmanager
+    def batch(self):
+        with self.lock:
+            self.holds += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.holds -= 1
+                flush_now = self.holds == 0 and (self.dirty or self.whole_page) and self._schedule()
+            if flush_now:
+                self.flush()
+
+    # Queue a flush on the event loop. Called with self.lock held; returns True
+    # when there is no running loop to defer to (e.g. driven headlessly) and
+    # the caller should flush right away instead.
+    def _schedule(self):
+        if self.scheduled:
+            return False
+        page = self.page_ref()
+        loop = page.loop if page is not None else None
+        if loop is None or not loop.is_running():
+            return True
+        self.scheduled = True
+        loop.call_soon_threadsafe(self.flush)
+        return False
+
+    def flush(self):
+        with self.lock:
+            self.scheduled = False
+            if self.holds:
+                # A batch opened since the flush was scheduled; its end reschedules
+                return
+            whole_page, dirty = self.whole_page, list(self.dirty.values())
+            self.whole_page, self.dirty = False, {}
+        if whole_page:
+            controls = ()
+        else:
+            # An update sends the control's whole subtree, so marked descendants
+            # of another marked control need no update of their own
+            marked = {id(control) for control in dirty}
+            controls = [control for control in dirty if not self._has_marked_ancestor(control, marked)]
+            if not controls:
+                return
+        page = self.page_ref()
+        if page is None:
+            return
+        try:
+            page.update(*controls)
+        except Exception as e:
+            print(f"Error rendering: {e!r}")
+
+    @staticmethod
+    def _has_marked_ancestor(control, marked):
+        parent = control.parent
+        while parent is not None:
+            if id(parent) in marked:
+                return True
+            parent = parent.parent
+        return False
+
+
+schedulers = weakref.WeakKeyDictionary()  # Page -> RenderScheduler
+schedulers_lock = threading.Lock()
+
+def scheduler(page):
+    with schedulers_lock:
+        if page not in schedulers:
+            schedulers[page] = RenderScheduler(page)
+        return schedulers[page]
+
+def render(page, *controls):
+    scheduler(page).mark(*controls)
+
+# Method decorator for event handlers and DB callbacks of controls (anything
+# with self.page): what they render is flushed once, after they return
+def batched(fn):
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with scheduler(self.page).batch():
+            return fn(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,217 @@
+import threading
+from collections import namedtuple
+
+from db.books import has_status
+from db.cache import BookCache, sort_key
+from db.schema import ensure_schema
+from metrics import LibraryTotals, MetricsEngine
+from planner import Planner
+
+# Display values of one book list row
+RowView = namedtuple("RowView", ["title", "read_percentage", "target_date", "daily_target", "overdue", "finished"])
+
+# Everything the app does before the book list can be drawn, apart from
+# building controls. Runs after the first frame, off the UI thread.
+def open_session(manager):
+    with manager.connection() as conn:
+        ensure_schema(conn)
+    return BookCache(manager)
+
+shared_caches = {}  # Manager -> BookCache shared by all its sessions
+shared_lock = threading.Lock()
+
+# Server mode: sessions of one process share the cache, so a write made in one
+# session is in memory for all of them and each only redraws the changed rows.
+# The cache is loaded on the writer: PRAGMA data_version values only compare on
+# one connection, and refresh_if_changed() checks them on the writer's.
+def open_shared_session(manager, writer):
+    with shared_lock:
+        if manager not in shared_caches:
+            with manager.connection() as conn:
+                ensure_schema(conn)
+            shared_caches[manager] = writer.submit(BookCache, manager).result()
+        return shared_caches[manager]
+
+
+# State and logic behind BookList, free of Flet controls so it can be driven
+# headlessly (see bench/). `books` holds the loaded books in display order;
+# BookList keeps its row controls in the same order. Not thread-safe on its
+# own: BookList serializes access with its load_lock.
+class BookListModel:
+    PAGE_SIZE = 50  # Rows loaded per batch
+
+    def __init__(self, cache, metrics=None):
+        self.cache = cache
+        self.metrics = metrics or MetricsEngine()
+        self.sort_by = "read_percentage"  # Default sorting criteria
+        self.sort_order = True  # True for ascending, False for descending
+        self.books = []
+        self.loaded = {}  # Book id -> the version of the book in self.books
+        self.exhausted = False  # True once every book has been loaded
+        self.totals = LibraryTotals()
+        self.totals_generation = None  # Cache generation the totals were built from
+        self.planner = Planner()
+        self.planner_generation = None  # Cache generation the planner was built from
+        self.query = ""  # Search text; while set, only matching books are listed
+        self.matches = None  # Ids of the matching books in list order, None when not searching
+        self.match_ids = set()
+        self.status = None  # One of db.books.STATUSES to list only those books, None for all
+
+    @property
+    def searching(self):
+        return self.matches is not None
+
+    # Show only the books in `ids` (the result of searching for `query`);
+    # ids=None goes back to the whole library. Call reset() afterwards.
+    def set_matches(self, query, ids):
+        self.query = query if ids is not None else ""
+        self.matches = None if ids is None else list(ids)
+        self.match_ids = set(ids or ())
+
+    # Show only the books with `status` (None for all). Call reset() afterwards.
+    def set_status(self, status):
+        self.status = status
+
+    def listed(self, book):
+        if self.status is not None and not has_status(book, self.status, self.metrics.today):
+            return False
+        return not self.searching or book.id in self.match_ids
+
+    def reset(self):
+        self.books = []
+        self.loaded = {}
+        self.exhausted = False
+        if self.searching:
+            # Matches come back unordered; sort them like the rest of the list
+            books = [book for book in map(self.cache.get, self.match_ids) if book is not None and self.listed(book)]
+            books.sort(key=self.sort_key, reverse=not self.sort_order)
+            self.matches = [book.id for book in books]
+        return self.load_more()
+
+    # Load the next batch; returns the books appended to the list
+    def load_more(self):
+        if self.searching:
+            ids = self.matches[len(self.books):len(self.books) + self.PAGE_SIZE]
+            books = [book for book in map(self.cache.get, ids) if book is not None]
+        else:
+            books = self.cache.page(self.sort_by, ascending=self.sort_order,
+                                    offset=len(self.books), limit=self.PAGE_SIZE, status=self.status)
+        # Metrics for the whole batch in one pass; formatting rows then only builds strings
+        self.metrics.prime(books)
+        self.books.extend(books)
+        self.loaded.update((book.id, book) for book in books)
+        self.exhausted = len(books) < self.PAGE_SIZE
+        return books
+
+    # Switch to sort_by, flipping the direction as the header buttons do
+    def toggle_sort(self, sort_by):
+        self.sort_by = sort_by
+        self.sort_order = not self.sort_order
+
+    def row_view(self, book):
+        metrics = self.metrics.get(book)
+        # Overdue means unfinished, as for the status filter and the summary
+        overdue = not book.finished and metrics.daily_target is None
+        if book.finished:
+            daily_target = "Finished"
+        elif overdue:
+            daily_target = "Target date passed"
+        else:
+            daily_target = f"{metrics.daily_target} pages/day"
+        return RowView(
+            title=book.title,
+            read_percentage=f"{metrics.read_percentage} %",
+            target_date=book.target_date.isoformat(),
+            daily_target=daily_target,
+            overdue=overdue,
+            finished=book.finished,
+        )
+
+    def summary_text(self):
+        if self.totals_generation != self.cache.generation or self.totals.today != self.metrics.today:
+            self.totals.rebuild(self.cache.all(), self.metrics.today)
+            self.totals_generation = self.cache.generation
+        summary = self.totals.summary
+        return (
+            f"{summary.daily_pages} pages/day across {summary.active_books} books"
+            f" · {summary.overdue_books} overdue"
+        )
+
+    # The reading plan, rebuilt only after a reload or at midnight; between
+    # those, insert(), update() and remove() keep it current book by book
+    def plan(self):
+        if self.planner_generation != self.cache.generation or self.planner.today != self.metrics.today:
+            self.planner.rebuild(self.cache.all(), self.metrics.today)
+            self.planner_generation = self.cache.generation
+        return self.planner
+
+    def sort_key(self, book):
+        return sort_key(book, self.sort_by)
+
+    def index_of(self, book_id):
+        book = self.loaded.get(book_id)
+        # Sort keys are unique (they end with the id), so bisecting finds the book itself
+        return None if book is None else self.sorted_position(book)
+
+    # Index at which the book belongs among the loaded books
+    def sorted_position(self, book):
+        key = self.sort_key(book)
+        low, high = 0, len(self.books)
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self.sort_key(self.books[middle])
+            if (middle_key < key) if self.sort_order else (middle_key > key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Add a new book. Returns its index in the list, or None (see place()).
+    def insert(self, book):
+        self.totals.replace(book.id, book)
+        self.planner.replace(book.id, book)
+        return self.place(book)
+
+    # Place a book at its sorted position. Books that sort past the loaded part
+    # of the list are left for load_more(), and only books passing the status
+    # filter and the search are placed; the caller runs the search again after
+    # a change. Returns the index, or None.
+    def place(self, book):
+        if not self.listed(book):
+            return None
+        position = self.sorted_position(book)
+        if position == len(self.books) and not self.exhausted:
+            return None
+        self.books.insert(position, book)
+        self.loaded[book.id] = book
+        return position
+
+    # Returns (old index, new index); either is None when the book is not loaded
+    def update(self, book):
+        self.totals.replace(book.id, book)
+        self.planner.replace(book.id, book)
+        old_index = self.index_of(book.id)
+        if old_index is not None:
+            if self.listed(book) and self.sort_key(self.books[old_index]) == self.sort_key(book):
+                self.books[old_index] = book
+                self.loaded[book.id] = book
+                return old_index, old_index
+            del self.books[old_index]
+            del self.loaded[book.id]
+        return old_index, self.place(book)
+
+    # Returns the index the book had, or None
+    def remove(self, book_id):
+        self.metrics.forget(book_id)
+        self.totals.replace(book_id, None)
+        self.planner.replace(book_id, None)
+        index = self.index_of(book_id)
+        if index is not None:
+            del self.books[index]
+            del self.loaded[book_id]
+        if book_id in self.match_ids:
+            self.match_ids.discard(book_id)
+            # match_ids keeps the books the status filter hides; matches does not
+            if book_id in self.matches:
+                self.matches.remove(book_id)
+        return index